@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Run an Indico CLI command through the warm admin server.
+
+Usage: admin_client.py indico <command> [<args>...]
+
+The command is sent to the admin server (see `admin_server.py`), followed by
+the standard input, unless it is a terminal, streamed while the command runs.
+Its output and exit code are relayed as if it was run directly. When the
+server is not available (e.g. still starting), or runs with another environment
+than the client's (e.g. not restarted yet after a configuration change), the
+command is run in a new process by `start-indico.sh`, with the environment of
+the client.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import typing
+
+ADMIN_SOCKET = os.environ.get("INDICO_ADMIN_SOCKET", "/srv/indico/tmp/admin.sock")
+INDICO_WRAPPER = "/srv/indico/start-indico.sh"
+# Digest of the environment set by the charm, compared by the server with its own
+ENVIRONMENT_DIGEST_ENV = "INDICO_ENVIRONMENT_DIGEST"
+# Size of the chunks of the standard input sent to the server
+STDIN_CHUNK_SIZE = 64 * 1024
+
+
+def send_stdin(conn: socket.socket, stdin: typing.Optional[int]):
+    """Stream the standard input to the server, then shut the sending side down.
+
+    The input is read from its file descriptor, so the thread may be left
+    blocked on it at exit once the command has finished.
+
+    Args:
+        conn: the connection to the server
+        stdin: file descriptor of the standard input, None to send nothing
+    """
+    try:
+        if stdin is not None:
+            while chunk := os.read(stdin, STDIN_CHUNK_SIZE):
+                conn.sendall(chunk)
+        conn.shutdown(socket.SHUT_WR)
+    except OSError:
+        # The command has finished without reading the whole input
+        pass
+
+
+def run_on_server(conn: socket.socket, argv: typing.List[str]) -> typing.Optional[int]:
+    """Run the command on the admin server, relaying its output.
+
+    Args:
+        conn: the connection to the server
+        argv: the command line, starting with `indico`
+
+    Returns:
+        the exit code of the command, None if the server runs with another environment
+    """
+    with conn.makefile("r", encoding="utf-8") as server:
+        request = {"args": argv[1:], "environment-digest": os.environ.get(ENVIRONMENT_DIGEST_ENV)}
+        conn.sendall((json.dumps(request) + "\n").encode())
+        # The standard input is only sent once the server accepted to run the command
+        if json.loads(server.readline() or "{}").get("stale"):
+            return None
+        stdin = None if sys.stdin.isatty() else sys.stdin.fileno()
+        threading.Thread(target=send_stdin, args=(conn, stdin), daemon=True).start()
+        for line in server:
+            message = json.loads(line)
+            if "exit-code" in message:
+                return message["exit-code"]
+            for name, stream in (("stdout", sys.stdout), ("stderr", sys.stderr)):
+                if name in message:
+                    stream.write(message[name])
+                    stream.flush()
+    print("Connection to the admin server lost", file=sys.stderr)
+    return 1
+
+
+def main(argv: typing.List[str]) -> int:
+    """Run the command through the admin server or fall back to a new process.
+
+    Args:
+        argv: the command line, starting with `indico`
+
+    Returns:
+        int: the exit code of the command
+    """
+    if argv[:1] != ["indico"]:
+        print(__doc__.strip().splitlines()[2], file=sys.stderr)
+        return 2
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with conn:
+        try:
+            conn.connect(ADMIN_SOCKET)
+        except OSError:
+            exit_code = None
+        else:
+            exit_code = run_on_server(conn, argv)
+    if exit_code is None:
+        os.execv(INDICO_WRAPPER, [INDICO_WRAPPER, *argv])
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Serve the Indico CLI commands of the charm actions from a single warm process.
+
+Indico and its plugins are imported and the Flask app is created once, then
+each command read from a Unix socket is run by the `indico` CLI group, including
+the commands registered by the plugins, in a process forked from the server. The
+commands run concurrently, so a long anonymization does not hold back the
+others, and each one gets its own database connections.
+
+Each request is a JSON line `{"args": [...], "environment-digest": "..."}`,
+where the arguments follow `indico`, followed by the standard input of the
+command until the client shuts its side of the connection down. The commands
+run with the environment of the server, created at its start, so a request whose
+environment digest (INDICO_ENVIRONMENT_DIGEST, set by the charm) differs from
+the one of the server, e.g. sent before the charm restarted it with a new
+configuration, is answered by `{"stale": true}` alone, the client then running
+the command in a new process. Otherwise the response starts with
+`{"accepted": true}` and is streamed as JSON lines: `{"stdout": "..."}` and
+`{"stderr": "..."}` as the command writes its output, then `{"exit-code": N}`
+once it has finished. See `admin_client.py`.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import traceback
+import typing
+
+import click
+
+ADMIN_SOCKET = os.environ.get("INDICO_ADMIN_SOCKET", "/srv/indico/tmp/admin.sock")
+# Only the command groups used by the charm actions can be run by the server
+ALLOWED_COMMANDS = ("anonymize", "autocreate")
+# Digest of the environment of the server set by the charm, also passed to the clients
+ENVIRONMENT_DIGEST = os.environ.get("INDICO_ENVIRONMENT_DIGEST")
+
+logger = logging.getLogger("indico-admin-server")
+
+
+class _FramedWriter(io.TextIOBase):
+    """Text stream sending everything written to it as JSON lines on a socket."""
+
+    def __init__(self, wfile: typing.TextIO, stream: str):
+        """Construct.
+
+        Args:
+            wfile: file object of the client connection
+            stream: name of the stream, either stdout or stderr
+        """
+        super().__init__()
+        self._wfile = wfile
+        self._stream = stream
+
+    @property
+    def encoding(self) -> str:
+        """Encoding of the stream, checked by click.
+
+        Returns:
+            str: the encoding
+        """
+        return "utf-8"
+
+    def writable(self) -> bool:
+        """Tell the stream is writable.
+
+        Returns:
+            bool: always True
+        """
+        return True
+
+    def write(self, text: str) -> int:
+        """Send some text to the client.
+
+        The command keeps running when the client has gone away so its chunks
+        are committed consistently; the rest of its output is dropped.
+
+        Args:
+            text: text written by the command
+
+        Returns:
+            int: number of characters written
+
+        Raises:
+            TypeError: if bytes are written, telling click the stream is a text one
+        """
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            try:
+                self._wfile.write(json.dumps({self._stream: text}) + "\n")
+                self._wfile.flush()
+            except OSError:
+                pass
+        return len(text)
+
+
+def run_command(cli, args: typing.List[str], obj: typing.Any) -> int:
+    """Run a command of a click group like its standalone mode would, without exiting.
+
+    Args:
+        cli: the click group
+        args: arguments of the command
+        obj: object passed to the click context
+
+    Returns:
+        int: the exit code of the command
+    """
+    try:
+        result = cli.main(args, prog_name="indico", standalone_mode=False, obj=obj)
+    except click.ClickException as exc:
+        exc.show()
+        return exc.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except SystemExit as exc:
+        return exc.code if isinstance(exc.code, int) else int(exc.code is not None)
+    except Exception:  # pylint: disable=broad-exception-caught
+        traceback.print_exc()
+        return 1
+    # On an explicit exit (e.g. ctx.exit(1)), the exit code is returned instead of raised
+    return result if isinstance(result, int) else 0
+
+
+def handle_connection(conn: socket.socket, cli, obj: typing.Any) -> typing.Optional[int]:
+    """Read a request from a client connection and stream the command output to it.
+
+    Args:
+        conn: the client connection
+        cli: the click group running the commands
+        obj: object passed to the click context
+
+    Returns:
+        the exit code of the command, None if left to the client for a stale environment
+    """
+    with (
+        conn.makefile("r", encoding="utf-8") as rfile,
+        conn.makefile("w", encoding="utf-8") as wfile,
+    ):
+        request = json.loads(rfile.readline() or "{}")
+        if request.get("environment-digest") != ENVIRONMENT_DIGEST:
+            with contextlib.suppress(OSError):
+                wfile.write(json.dumps({"stale": True}) + "\n")
+                wfile.flush()
+            return None
+        with contextlib.suppress(OSError):
+            wfile.write(json.dumps({"accepted": True}) + "\n")
+            wfile.flush()
+        args = request.get("args") or []
+        stdout = _FramedWriter(wfile, "stdout")
+        stderr = _FramedWriter(wfile, "stderr")
+        if not args or args[0] not in ALLOWED_COMMANDS:
+            stderr.write(f"Command not allowed, expected one of: {', '.join(ALLOWED_COMMANDS)}\n")
+            exit_code = 2
+        else:
+            # The standard input is read from the connection as the command consumes it
+            previous_stdin = sys.stdin
+            sys.stdin = rfile
+            try:
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                    exit_code = run_command(cli, args, obj)
+            finally:
+                sys.stdin = previous_stdin
+        with contextlib.suppress(OSError):
+            wfile.write(json.dumps({"exit-code": exit_code}) + "\n")
+            wfile.flush()
+    return exit_code
+
+
+def serve(path: str = ADMIN_SOCKET):
+    """Create the Indico app and run the commands received on a Unix socket forever.
+
+    Args:
+        path: path of the Unix socket
+    """
+    # pylint: disable=import-outside-toplevel
+    from flask.cli import ScriptInfo
+    from indico.cli.core import cli
+    from indico.core.db import db
+    from indico.web.flask.app import make_app
+
+    app = make_app()
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the workload user may connect to the socket
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    # The finished commands are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    logger.info("Indico admin server listening on %s", path)
+    while True:
+        conn, _ = server.accept()
+        if os.fork():
+            conn.close()
+            continue
+        server.close()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        try:
+            with conn, app.app_context():
+                # The connections inherited from the server are left to it
+                for engine in db.engines.values():
+                    engine.dispose(close=False)
+                exit_code = handle_connection(
+                    conn, cli, ScriptInfo(create_app=lambda: app, set_debug_flag=False)
+                )
+                if exit_code is None:
+                    logger.info("Command left to a new process, the environment changed")
+                else:
+                    logger.info("Command finished with exit code %s", exit_code)
+        except (OSError, ValueError):
+            logger.exception("Invalid request")
+        finally:
+            logging.shutdown()
+            os._exit(0)  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
@@ -7,8 +7,128 @@ The extension's default Gunicorn command resolves ``app:app``. Indico itself
 exposes an application factory at ``indico.web.flask.app:make_app``; this shim
 adapts the two so the extension contract is satisfied without overriding the
 Pebble service command.
+
+The startup phases (the plugin check of ``start-indico.sh``, the Indico
+imports, ``make_app()`` and the total time since the wrapper started) are
+logged as JSON lines and sent to the statsd exporter as the
+``indico_startup_phase_seconds`` gauge, labelled by phase. The plugin check and
+the total time are only reported by the first process importing this module
+after the wrapper started, not by the workers Gunicorn respawns later.
+
+When the ``preload-app`` charm option is set, Gunicorn imports this module in
+its master process and forks the workers from it. The app is then built only
+once and its memory is shared copy-on-write by the workers: the objects built so
+far are frozen out of the garbage collector so that collections in the workers
+do not touch, and copy, their pages. The database and Redis connections opened
+by the master are not reused by the workers, which open their own after the fork.
+The charm only preloads the app with the sync workers, as gevent would
+monkey-patch the workers after the master imported this module.
+
+In the gevent workers, the PostgreSQL driver is made to yield to the other
+requests while waiting for the database.
 """
 
-from indico.web.flask.app import make_app
+import gc
+import importlib
+import json
+import os
+import socket
+import sys
+import time
+import typing
+
+# Address of the statsd exporter running next to the workload
+STATSD_ADDRESS = ("localhost", 9125)
+
+
+def report_startup(phases: typing.Dict[str, float]) -> None:
+    """Log the startup phases and send them to the statsd exporter.
+
+    Args:
+        phases: duration of each startup phase, in seconds
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for phase, seconds in phases.items():
+            print(
+                json.dumps({"event": "startup", "phase": phase, "seconds": round(seconds, 3)}),
+                file=sys.stderr,
+            )
+            try:
+                sock.sendto(
+                    f"indico_startup_phase_seconds:{seconds:.3f}|g|#phase:{phase}".encode(),
+                    STATSD_ADDRESS,
+                )
+            except OSError:
+                pass
+
+
+def claim_startup_marker() -> bool:
+    """Remove the startup marker of the wrapper, left for the first process importing this module.
+
+    Returns:
+        bool: True if this process removed it, or if the wrapper did not set one
+    """
+    marker = os.environ.get("INDICO_STARTUP_MARKER")
+    if not marker:
+        return True
+    try:
+        os.unlink(marker)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def reset_connections(flask_app) -> None:
+    """Drop the database and Redis connections inherited from the parent process.
+
+    The connections are left open for the parent, only the pools of the child
+    forget them.
+
+    Args:
+        flask_app: the Indico Flask app
+    """
+    # pylint: disable=import-outside-toplevel
+    from indico.core.db import db
+
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    for backend in flask_app.extensions.get("cache", {}).values():
+        for client in {
+            getattr(backend, "_write_client", None),
+            getattr(backend, "_read_client", None),
+        }:
+            if client is not None:
+                client.connection_pool.reset()
+
+
+def patch_psycopg() -> None:
+    """Make the PostgreSQL queries cooperative when the worker is monkey-patched by gevent."""
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is None or not gevent_monkey.is_module_patched("socket"):
+        return
+    # pylint: disable=import-outside-toplevel
+    from psycogreen.gevent import patch_psycopg as patch_psycopg_gevent
+
+    patch_psycopg_gevent()
+
 
+patch_psycopg()
+_start = time.monotonic()
+make_app = importlib.import_module("indico.web.flask.app").make_app
+_imported = time.monotonic()
 app = make_app()
+_startup_phases = {"imports": _imported - _start, "make-app": time.monotonic() - _imported}
+# Only the first process after the wrapper started, the time since then no longer
+# being a startup time in the respawned workers
+if claim_startup_marker():
+    if "INDICO_STARTUP_PLUGINS_MS" in os.environ:
+        _startup_phases["plugins"] = int(os.environ["INDICO_STARTUP_PLUGINS_MS"]) / 1000
+    if "INDICO_STARTUP_STARTED_MS" in os.environ:
+        _startup_phases["total"] = (
+            time.time() - int(os.environ["INDICO_STARTUP_STARTED_MS"]) / 1000
+        )
+report_startup(_startup_phases)
+if os.environ.get("FLASK_PRELOAD_APP") == "true":
+    os.register_at_fork(after_in_child=lambda: reset_connections(app))
+    gc.freeze()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Share the installed external plugins between units through the S3 bucket.
+
+Usage: plugin_bundle.py (download [--wait <seconds>] | upload) <key> <plugin-dir>
+
+The site-packages of the plugin dir (`lib/`) are stored as a single tarball in
+the bucket of the s3 relation, under a key derived from the requested plugins
+and the Indico version. The unit building the plugins uploads the tarball once
+installed, the other units download and unpack it instead of building the
+plugins themselves. `download` exits with 1 when the tarball does not exist,
+after waiting for it to be uploaded when `--wait` is set.
+"""
+
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import typing
+
+# Prefix of the plugin tarballs in the bucket
+BUNDLE_PREFIX = "indico-plugin-bundles"
+# Interval between two checks while waiting for a tarball to be uploaded
+POLL_INTERVAL = 10
+
+
+def s3_client():
+    """Create an S3 client from the environment of the s3 relation.
+
+    Returns:
+        the boto3 S3 client
+    """
+    # boto3 is installed along with the storage_s3 plugin baked into the rock
+    import boto3  # pylint: disable=import-outside-toplevel
+    from botocore.config import Config  # pylint: disable=import-outside-toplevel
+
+    addressing_style = os.environ.get("S3_ADDRESSING_STYLE") or os.environ.get("S3_URI_STYLE")
+    return boto3.client(
+        "s3",
+        endpoint_url=os.environ.get("S3_ENDPOINT") or None,
+        region_name=os.environ.get("S3_REGION") or None,
+        aws_access_key_id=os.environ.get("S3_ACCESS_KEY"),
+        aws_secret_access_key=os.environ.get("S3_SECRET_KEY"),
+        config=Config(s3={"addressing_style": addressing_style or "auto"}),
+    )
+
+
+def download(client, key: str, plugin_dir: str, wait: int = 0) -> bool:
+    """Download a plugin tarball and replace the site-packages of the plugin dir with it.
+
+    Args:
+        client: the S3 client
+        key: key of the tarball, without prefix
+        plugin_dir: the plugin dir
+        wait: number of seconds to wait for the tarball to be uploaded
+
+    Returns:
+        bool: True if the tarball was unpacked, False if it does not exist
+    """
+    deadline = time.monotonic() + wait
+    with tempfile.TemporaryDirectory(dir=plugin_dir) as tmp:
+        archive = os.path.join(tmp, "bundle.tar.gz")
+        while True:
+            try:
+                client.download_file(
+                    os.environ["S3_BUCKET"], f"{BUNDLE_PREFIX}/{key}.tar.gz", archive
+                )
+                break
+            except client.exceptions.ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                    raise
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        with tarfile.open(archive) as tar:
+            tar.extractall(os.path.join(tmp, "bundle"), filter="data")
+        # Unpacked aside first so a failed download never leaves partial plugins
+        shutil.rmtree(os.path.join(plugin_dir, "lib"), ignore_errors=True)
+        os.replace(os.path.join(tmp, "bundle", "lib"), os.path.join(plugin_dir, "lib"))
+    return True
+
+
+def upload(client, key: str, plugin_dir: str):
+    """Upload the site-packages of the plugin dir as a plugin tarball.
+
+    Args:
+        client: the S3 client
+        key: key of the tarball, without prefix
+        plugin_dir: the plugin dir
+    """
+    with tempfile.TemporaryDirectory(dir=plugin_dir) as tmp:
+        archive = os.path.join(tmp, "bundle.tar.gz")
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(os.path.join(plugin_dir, "lib"), arcname="lib")
+        client.upload_file(archive, os.environ["S3_BUCKET"], f"{BUNDLE_PREFIX}/{key}.tar.gz")
+
+
+def main(argv: typing.List[str]) -> int:
+    """Download or upload a plugin tarball.
+
+    Args:
+        argv: the command line arguments
+
+    Returns:
+        int: the exit code, 1 when the tarball to download does not exist
+    """
+    wait = 0
+    if argv[:1] == ["download"] and argv[1:2] == ["--wait"]:
+        wait = int(argv[2])
+        argv = argv[:1] + argv[3:]
+    if len(argv) != 3 or argv[0] not in ("download", "upload"):
+        print(__doc__.strip().splitlines()[2], file=sys.stderr)
+        return 2
+    command, key, plugin_dir = argv
+    if command == "upload":
+        upload(s3_client(), key, plugin_dir)
+        return 0
+    return 0 if download(s3_client(), key, plugin_dir, wait) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -4,15 +4,39 @@
 
 """Anonymize users non-interactively."""
 
+import collections
+import itertools
+import json
+import time
 import typing
 import uuid
 
 import click
 from indico.cli.core import cli_group
+from indico.core.celery import AsyncResult
 from indico.core.db import db
-from indico.modules.events.registration.models.form_fields import RegistrationFormField
-from indico.modules.events.registration.models.registrations import Registration
+from indico.modules.auth import Identity
+from indico.modules.events.abstracts.models.persons import AbstractPersonLink
+from indico.modules.events.contributions.models.persons import (
+    ContributionPersonLink,
+    SubContributionPersonLink,
+)
+from indico.modules.events.models.persons import EventPerson, EventPersonLink
+from indico.modules.events.registration.models.form_fields import (
+    RegistrationFormField,
+    RegistrationFormFieldData,
+)
+from indico.modules.events.registration.models.items import RegistrationFormItem
+from indico.modules.events.registration.models.registrations import (
+    Registration,
+    RegistrationData,
+)
+from indico.modules.events.sessions.models.persons import SessionBlockPersonLink
 from indico.modules.users import User
+from indico.modules.users.models.emails import UserEmail
+from sqlalchemy import bindparam, event
+
+from anonymize.storage import StoredFileBatch
 
 
 def _generate_uuid() -> str:
@@ -38,6 +62,91 @@ CLEAN_ATTRS: typing.Dict[str, typing.Callable] = {
     "address": _generate_uuid,
 }
 
+# Registration field types whose values are anonymized. Dates and countries are kept
+# for now and other field types are not touched (choice, multiple choice, radio).
+ANONYMIZED_FIELD_TYPES = ("text", "textarea", "email", "phone")
+ANONYMIZED_PHONE = "(+00) 0000000"
+
+# Links of the event persons to the events (chairpersons), session blocks (conveners),
+# abstracts and contributions, whose own personal data overrides the one of the
+# person when set
+PERSON_LINK_MODELS = {
+    "event-person-links": EventPersonLink,
+    "session-block-person-links": SessionBlockPersonLink,
+    "abstract-person-links": AbstractPersonLink,
+    "contribution-person-links": ContributionPersonLink,
+    "subcontribution-person-links": SubContributionPersonLink,
+}
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_FIELD_TYPE_CACHE_SIZE = 10000
+
+# How the anonymization is verified once committed: with one query per user
+# (each), with a single set query for all the users committed together (batch)
+# or not at all (none).
+VERIFY_MODES = ("each", "batch", "none")
+DEFAULT_VERIFY_MODE = "batch"
+
+
+class FieldTypeCache:
+    """Bounded LRU cache of the input type of registration form fields.
+
+    Meant to be scoped to one anonymization run: users who attended the same
+    events share the fields of the same registration forms, whose input types
+    are then only fetched once.
+
+    Attributes:
+        maxsize: maximum number of fields kept in the cache
+        hits: number of field lookups served from the cache
+        misses: number of field lookups fetched from the DB
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_FIELD_TYPE_CACHE_SIZE):
+        """Construct.
+
+        Args:
+            maxsize: maximum number of fields kept in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._input_types: typing.OrderedDict[int, str] = collections.OrderedDict()
+
+    def get_many(self, field_ids: typing.Iterable[int]) -> typing.Dict[int, str]:
+        """Get the input type of some fields, fetching the missing ones in a single query.
+
+        Args:
+            field_ids: IDs of the registration form fields
+
+        Returns:
+            dict: input type of each field
+        """
+        field_ids = set(field_ids)
+        missing = field_ids.difference(self._input_types)
+        self.hits += len(field_ids) - len(missing)
+        self.misses += len(missing)
+        input_types = {field_id: self._input_types[field_id] for field_id in field_ids - missing}
+        if missing:
+            # db.session has query()
+            query = db.session.query(  # pylint: disable=no-member
+                RegistrationFormItem.id, RegistrationFormItem.input_type
+            )
+            input_types.update(query.filter(RegistrationFormItem.id.in_(missing)))
+        for field_id, input_type in input_types.items():
+            self._input_types[field_id] = input_type
+            self._input_types.move_to_end(field_id)
+        while len(self._input_types) > self.maxsize:
+            self._input_types.popitem(last=False)
+        return input_types
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Get the cache counters.
+
+        Returns:
+            dict: number of hits, misses and cached fields
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._input_types)}
+
 
 @cli_group(name="anonymize")
 def cli():
@@ -56,42 +165,62 @@ def anonymize_deleted_user(user: User):
         setattr(user, attr, anonymize_val())
 
 
+def _anonymized_field_data(input_type: str, email: str) -> str:
+    """Generate the anonymized value of a registration field.
+
+    Args:
+        input_type: input type of the field, one of ANONYMIZED_FIELD_TYPES
+        email: anonymized email of the registration
+
+    Returns:
+        str: anonymized value
+    """
+    if input_type == "email":
+        return email
+    if input_type == "phone":
+        return ANONYMIZED_PHONE
+    return _generate_uuid()
+
+
+def _anonymized_registration_attrs() -> typing.Dict[str, str]:
+    """Generate the anonymized personal attributes of a registration.
+
+    Returns:
+        dict: anonymized first name, last name and email
+    """
+    first_name = _generate_uuid()
+    return {
+        "first_name": first_name,
+        "last_name": _generate_uuid(),
+        "email": f"{first_name}@{_generate_uuid()}.local",
+    }
+
+
 def anonymize_registration(registration: Registration):
     """Anonymize registration by changing specific attributes.
 
     Args:
         registration (Registration): User registration_
     """
-    first_name = _generate_uuid()
-    email = f"{first_name}@{_generate_uuid()}.local"
+    attrs = _anonymized_registration_attrs()
 
     for fid, rdata in registration.data_by_field.items():
         fieldtype = RegistrationFormField.get(oid=fid).input_type
-        if fieldtype in ("text", "textarea"):
-            rdata.data = _generate_uuid()
-        elif fieldtype == "email":
-            rdata.data = email
-        elif fieldtype == "phone":
-            rdata.data = "(+00) 0000000"
-        elif fieldtype == "date":
-            # Keep dates for now
-            pass
-        elif fieldtype == "country":
-            # Keep country for now
-            pass
-        # other field types are not touched (choice, multiple choice, radio)
-
-    registration.first_name = first_name
-    registration.last_name = _generate_uuid()
-    registration.email = email
+        if fieldtype in ANONYMIZED_FIELD_TYPES:
+            rdata.data = _anonymized_field_data(fieldtype, attrs["email"])
+
+    for attr, value in attrs.items():
+        setattr(registration, attr, value)
     if registration.user:
         registration.user = None
 
 
 # Based on:
 # https://github.com/bpedersen2/indico-cron-advanced-cleaner/
-def anonymize_registrations(user: User):
-    """Anonymize user by erasing registrations attributes.
+def anonymize_registrations_per_row(user: User):
+    """Anonymize user by erasing registrations attributes one ORM object at a time.
+
+    Kept as the reference implementation of anonymize_registrations.
 
     Args:
         user: Indico user
@@ -101,15 +230,370 @@ def anonymize_registrations(user: User):
         anonymize_registration(registration)
 
 
+def anonymize_registrations(
+    user: User,
+    field_types: typing.Optional[FieldTypeCache] = None,
+    rows: typing.Optional[typing.Counter[str]] = None,
+) -> typing.List[typing.Tuple[str, str]]:
+    """Anonymize user by erasing registrations attributes with set-based statements.
+
+    The registrations and their field values are fetched with one query each and
+    the input types of the fields are resolved through the cache, then all the
+    rows are updated with one executemany UPDATE per table, whatever the number
+    of registrations and fields. The uploaded files are detached from all the
+    registrations with a single UPDATE, the caller being responsible for deleting
+    them from their storage once committed.
+
+    Args:
+        user: Indico user
+        field_types: cache of the field input types shared by the anonymization run
+        rows: counter of the rows written per kind, updated in place
+
+    Returns:
+        list: storage backend and file id of each detached uploaded file
+    """
+    if rows is None:
+        rows = collections.Counter()
+    if field_types is None:
+        field_types = FieldTypeCache()
+    # db.session has query()
+    registrations_query = db.session.query(Registration.id)  # pylint: disable=no-member
+    registration_ids = [
+        registration_id
+        for (registration_id,) in registrations_query.filter(Registration.user_id == user.id)
+    ]
+    if not registration_ids:
+        return []
+    attrs = {
+        registration_id: _anonymized_registration_attrs() for registration_id in registration_ids
+    }
+
+    # db.session has query()
+    field_values = (
+        db.session.query(  # pylint: disable=no-member
+            RegistrationData.registration_id,
+            RegistrationData.field_data_id,
+            RegistrationFormFieldData.field_id,
+        )
+        .join(
+            RegistrationFormFieldData,
+            RegistrationData.field_data_id == RegistrationFormFieldData.id,
+        )
+        .filter(RegistrationData.registration_id.in_(registration_ids))
+        .all()
+    )
+    input_types = field_types.get_many(field_id for _, _, field_id in field_values)
+    data_params = [
+        {
+            "b_registration_id": registration_id,
+            "b_field_data_id": field_data_id,
+            "b_data": _anonymized_field_data(
+                input_types[field_id], attrs[registration_id]["email"]
+            ),
+        }
+        for registration_id, field_data_id, field_id in field_values
+        if input_types.get(field_id) in ANONYMIZED_FIELD_TYPES
+    ]
+
+    registrations = Registration.__table__
+    # db.session has execute()
+    db.session.execute(  # pylint: disable=no-member
+        registrations.update()
+        .where(registrations.c.id == bindparam("b_id"))
+        .values(
+            first_name=bindparam("b_first_name"),
+            last_name=bindparam("b_last_name"),
+            email=bindparam("b_email"),
+            user_id=None,
+        ),
+        [
+            {
+                "b_id": registration_id,
+                "b_first_name": values["first_name"],
+                "b_last_name": values["last_name"],
+                "b_email": values["email"],
+            }
+            for registration_id, values in attrs.items()
+        ],
+    )
+    if data_params:
+        registration_data = RegistrationData.__table__
+        # db.session has execute()
+        db.session.execute(  # pylint: disable=no-member
+            registration_data.update()
+            .where(
+                registration_data.c.registration_id == bindparam("b_registration_id"),
+                registration_data.c.field_data_id == bindparam("b_field_data_id"),
+            )
+            .values(data=bindparam("b_data", type_=registration_data.c.data.type)),
+            data_params,
+        )
+    detached = detach_registration_files(registration_ids)
+    rows.update(
+        {
+            "registrations": len(registration_ids),
+            "field-values": len(data_params),
+            "files": len(detached),
+        }
+    )
+    return detached
+
+
+def detach_registration_files(
+    registration_ids: typing.List[int],
+) -> typing.List[typing.Tuple[str, str]]:
+    """Remove the uploaded files from some registrations with a single UPDATE.
+
+    Args:
+        registration_ids: ids of the registrations
+
+    Returns:
+        list: storage backend and file id of each detached file
+    """
+    registration_data = RegistrationData.__table__
+    # RETURNING only sees the updated values, the previous ones are read from a self-join
+    previous = registration_data.alias("previous")
+    # db.session has execute()
+    detached = db.session.execute(  # pylint: disable=no-member
+        registration_data.update()
+        .where(
+            registration_data.c.registration_id == previous.c.registration_id,
+            registration_data.c.field_data_id == previous.c.field_data_id,
+            previous.c.registration_id.in_(registration_ids),
+            previous.c.storage_file_id.isnot(None),
+        )
+        .values(
+            filename=None,
+            content_type=None,
+            size=None,
+            md5=None,
+            storage_backend=None,
+            storage_file_id=None,
+        )
+        .returning(previous.c.storage_backend, previous.c.storage_file_id)
+    )
+    return [(backend, file_id) for backend, file_id in detached]
+
+
+def anonymize_event_persons(
+    user: User, emails: typing.List[str], rows: typing.Optional[typing.Counter[str]] = None
+) -> int:
+    """Anonymize the event persons of a user and their links with set-based statements.
+
+    The persons linked to the user or to one of their emails are anonymized with
+    a single UPDATE, each one getting its own random names, then the personal
+    data overriding theirs in the event, session block, abstract and
+    contribution person links is cleared with one UPDATE per link table.
+
+    Args:
+        user: Indico user
+        emails: all the emails of the user
+        rows: counter of the rows written per kind, updated in place
+
+    Returns:
+        int: number of anonymized event persons
+    """
+    persons = EventPerson.__table__
+    conditions = [persons.c.user_id == user.id]
+    if emails:
+        conditions.append(persons.c.email.in_(emails))
+    # db.session has execute()
+    person_ids = [
+        person_id
+        for (person_id,) in db.session.execute(  # pylint: disable=no-member
+            persons.update()
+            .where(db.or_(*conditions))
+            .values(
+                user_id=None,
+                # Generated per row, so distinct persons stay distinct
+                first_name=db.cast(db.func.gen_random_uuid(), persons.c.first_name.type),
+                last_name=db.cast(db.func.gen_random_uuid(), persons.c.last_name.type),
+                email="",
+                affiliation="",
+                affiliation_id=None,
+                address="",
+                phone="",
+            )
+            .returning(persons.c.id)
+        )
+    ]
+    if not person_ids:
+        return 0
+    if rows is None:
+        rows = collections.Counter()
+    rows["event-persons"] += len(person_ids)
+    for name, model in PERSON_LINK_MODELS.items():
+        links = model.__table__
+        # db.session has execute()
+        rows[name] += db.session.execute(  # pylint: disable=no-member
+            links.update()
+            .where(links.c.person_id.in_(person_ids))
+            .values(
+                first_name=None,
+                last_name=None,
+                affiliation=None,
+                affiliation_id=None,
+                address=None,
+                phone=None,
+            )
+        ).rowcount
+    return len(person_ids)
+
+
+def anonymize_email(
+    email: str,
+    field_types: typing.Optional[FieldTypeCache] = None,
+    files: typing.Optional[StoredFileBatch] = None,
+) -> typing.Dict[str, str]:
+    """Anonymize the user owning an email within the current DB session.
+
+    Nothing is committed; the caller is responsible for committing the session
+    and then deleting the files of the user recorded in the batch.
+
+    Args:
+        email: email of the user to be anonymized
+        field_types: cache of the field input types shared by the anonymization run
+        files: batch recording the uploaded files to delete once committed
+
+    Returns:
+        dict: result of the anonymization with the email, its status and, once
+            anonymized, the number of rows written per kind and their total
+    """
+    users = User.query.filter(User.all_emails == email)
+    if not users.has_rows():
+        return {"email": email, "status": "not-found"}
+    user = users.first()
+
+    rows: typing.Counter[str] = collections.Counter(users=1)
+    # Event persons are also matched by email, which are erased with the user
+    anonymize_event_persons(user, list(user.all_emails), rows)
+    # We mark as deleted so won't appear in search users forms
+    user.is_deleted = True
+    anonymize_deleted_user(user)
+    # Anonymize registrations
+    for backend, file_id in anonymize_registrations(user, field_types, rows):
+        if files is not None:
+            files.add(backend, file_id, email)
+    return {"email": email, "status": "anonymized", "counts": rows, "rows": rows.total()}
+
+
+def is_anonymized(email: str) -> bool:
+    """Check that no user can be found anymore for an email.
+
+    Args:
+        email: email of the user that was anonymized
+
+    Returns:
+        bool: whether the email no longer matches any user
+    """
+    return not User.query.filter(User.all_emails == email).has_rows()
+
+
+def not_anonymized(emails: typing.List[str], verify: str) -> typing.Set[str]:
+    """Find the emails that still match a user after their anonymization was committed.
+
+    Args:
+        emails: emails of the users that were anonymized
+        verify: verification mode, one of VERIFY_MODES
+
+    Returns:
+        set: emails whose user was not anonymized
+    """
+    if verify == "each":
+        return {email for email in emails if not is_anonymized(email)}
+    if verify == "batch" and emails:
+        # db.session has query()
+        query = db.session.query(UserEmail.email)  # pylint: disable=no-member
+        return {email for (email,) in query.filter(UserEmail.email.in_(emails))}
+    return set()
+
+
+_verify_option = click.option(
+    "--verify",
+    type=click.Choice(VERIFY_MODES),
+    default=DEFAULT_VERIFY_MODE,
+    show_default=True,
+    help="Verify the anonymization with one query per user, one query per chunk or not at all.",
+)
+
+
+def estimate_email(email: str) -> typing.Dict[str, typing.Any]:
+    """Count the rows the anonymization of the user owning an email would write.
+
+    Only COUNT queries are run, in a single round trip once the user is found.
+
+    Args:
+        email: email of the user to be anonymized
+
+    Returns:
+        dict: result of the estimation with the email, its status, the number
+            of rows per kind and their total
+    """
+    # db.session has query()
+    user_id = (
+        db.session.query(UserEmail.user_id)  # pylint: disable=no-member
+        .filter(UserEmail.email == email)
+        .limit(1)
+        .scalar()
+    )
+    if user_id is None:
+        return {"email": email, "status": "not-found"}
+
+    # db.session has query()
+    user_emails = db.session.query(UserEmail.email).filter(  # pylint: disable=no-member
+        UserEmail.user_id == user_id
+    )
+    user_persons = db.or_(EventPerson.user_id == user_id, EventPerson.email.in_(user_emails))
+    count_queries = {
+        "emails": UserEmail.query.filter(UserEmail.user_id == user_id),
+        "identities": Identity.query.filter(Identity.user_id == user_id),
+        "registrations": Registration.query.filter(Registration.user_id == user_id),
+        "field-values": RegistrationData.query.join(Registration)
+        .join(RegistrationFormFieldData)
+        .join(RegistrationFormItem, RegistrationFormFieldData.field_id == RegistrationFormItem.id)
+        .filter(
+            Registration.user_id == user_id,
+            RegistrationFormItem.input_type.in_(ANONYMIZED_FIELD_TYPES),
+        ),
+        "files": RegistrationData.query.join(Registration).filter(
+            Registration.user_id == user_id, RegistrationData.storage_file_id.isnot(None)
+        ),
+        "event-persons": EventPerson.query.filter(user_persons),
+        **{
+            name: model.query.join(EventPerson, model.person_id == EventPerson.id).filter(
+                user_persons
+            )
+            for name, model in PERSON_LINK_MODELS.items()
+        },
+    }
+    # db.session has query()
+    row = db.session.query(  # pylint: disable=no-member
+        *(
+            query.with_entities(db.func.count()).scalar_subquery().label(name)
+            for name, query in count_queries.items()
+        )
+    ).one()
+    counts = {"users": 1, **row._asdict()}
+    return {"email": email, "status": "found", "counts": counts, "rows": sum(counts.values())}
+
+
 @cli.command("user")
 @click.argument("email", type=str)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only count the rows that would be anonymized, without changing any data.",
+)
+@_verify_option
 @click.pass_context
-def anonymize_user(ctx, email):
+def anonymize_user(ctx, email, dry_run, verify):
     """Anonymize user non-interactively.
 
     Args:
         ctx: context
         email: email of the user to be anonymized
+        dry_run: whether to only count the rows that would be anonymized
+        verify: how to verify the anonymization once committed
     """
     email = email.lower()
 
@@ -117,25 +601,359 @@ def anonymize_user(ctx, email):
         click.secho("E-mail should not be empty", fg="red")
         ctx.exit(1)
 
-    users = User.query.filter(User.all_emails == email)
-    if not users.has_rows():
-        click.secho(f"No user found for email {email}", fg="yellow")
+    if dry_run:
+        click.echo(json.dumps(estimate_email(email)))
+        # db.session has rollback()
+        db.session.rollback()  # pylint: disable=no-member
         ctx.exit(0)
-    user = users.first()
 
-    # We mark as deleted so won't appear in search users forms
-    user.is_deleted = True
-    anonymize_deleted_user(user)
-    # Anonymize registrations
-    anonymize_registrations(user)
+    result = anonymize_email(email)
+    if result["status"] == "not-found":
+        click.secho(f"No user found for email {email}", fg="yellow")
+        ctx.exit(0)
 
     # db.session has commit()
     db.session.commit()  # pylint: disable=no-member
 
     # Validate the changes
-    users = User.query.filter(User.all_emails == email)
-    if users.has_rows():
-        click.secho("User with email {email} was not anonymized", fg="red")
+    if not_anonymized([email], verify):
+        click.secho(f"User with email {email} was not anonymized", fg="red")
         ctx.exit(1)
 
     click.secho(f"User with email {email} correctly anonymized", fg="green")
+
+
+def _read_emails(lines: typing.Iterable[str]) -> typing.Iterator[str]:
+    """Lazily normalize the emails found in some lines of text.
+
+    Args:
+        lines: lines of text containing emails separated by commas or whitespaces
+
+    Yields:
+        str: lowercase email
+    """
+    for line in lines:
+        for email in line.replace(",", " ").split():
+            yield email.lower()
+
+
+def _chunked(iterable: typing.Iterable[str], size: int) -> typing.Iterator[typing.List[str]]:
+    """Split an iterable in lists of a fixed size without consuming it all.
+
+    Args:
+        iterable: iterable to split
+        size: maximum size of each list
+
+    Yields:
+        list: next chunk of the iterable
+    """
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def anonymize_chunk(
+    emails: typing.List[str],
+    field_types: typing.Optional[FieldTypeCache] = None,
+    verify: str = DEFAULT_VERIFY_MODE,
+) -> typing.List[typing.Dict[str, str]]:
+    """Anonymize the users of some emails and commit them together.
+
+    Each user is processed inside its own savepoint so a failure only discards
+    the changes of that user. The uploaded files of all the users are deleted
+    from their storage once committed, in batches per storage backend.
+
+    Args:
+        emails: emails of the users to be anonymized
+        field_types: cache of the field input types shared by the anonymization run
+        verify: how to verify the anonymization once committed
+
+    Returns:
+        list: result of the anonymization of each email
+    """
+    results = []
+    files = StoredFileBatch()
+    for email in emails:
+        try:
+            # db.session has begin_nested()
+            with db.session.begin_nested():  # pylint: disable=no-member
+                results.append(anonymize_email(email, field_types, files))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            files.discard(email)
+            results.append({"email": email, "status": "error", "message": str(exc)})
+
+    # db.session has commit()
+    db.session.commit()  # pylint: disable=no-member
+    # Files are only deleted once they are no longer referenced
+    failed_files = files.delete()
+
+    # Validate the changes
+    failed = not_anonymized(
+        [result["email"] for result in results if result["status"] == "anonymized"], verify
+    )
+    for result in results:
+        if result["email"] in failed:
+            result.update(status="error", message="User was not anonymized")
+        elif result["email"] in failed_files:
+            result.update(status="error", message=failed_files[result["email"]])
+    return results
+
+
+def estimate_chunk(emails: typing.List[str]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Count the rows the anonymization of the users of some emails would write.
+
+    Args:
+        emails: emails of the users to be anonymized
+
+    Returns:
+        list: result of the estimation of each email
+    """
+    results = [estimate_email(email) for email in emails]
+    # db.session has rollback()
+    db.session.rollback()  # pylint: disable=no-member
+    return results
+
+
+@cli.command("users")
+@click.argument("emails", nargs=-1, type=str)
+@click.option(
+    "--input",
+    "-i",
+    "input_file",
+    type=click.File("r"),
+    default="-",
+    help="File to read the emails from when none is given as argument (default: stdin).",
+)
+@click.option(
+    "--output",
+    "-o",
+    "output_file",
+    type=click.File("a"),
+    default=None,
+    help="File to append the JSON result of each email to instead of printing it.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="Number of users anonymized and committed together.",
+)
+@click.option(
+    "--field-type-cache-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_FIELD_TYPE_CACHE_SIZE,
+    show_default=True,
+    help="Maximum number of registration form fields whose input type is cached.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only count the rows that would be anonymized, without changing any data.",
+)
+@_verify_option
+@click.pass_context
+def anonymize_users(  # pylint: disable=too-many-arguments
+    ctx, emails, input_file, output_file, chunk_size, field_type_cache_size, dry_run, verify
+):
+    """Anonymize many users non-interactively in a single process.
+
+    Emails are taken from the arguments or, when none is given, read from the
+    input file (one or more per line). The emails are streamed in chunks of
+    fixed size, each one committed in a single transaction of the same DB
+    session. One JSON object per email is written with its result, followed
+    after each chunk by a JSON progress line and at the end by a JSON summary
+    along with the hit/miss counters of the field input types cache.
+
+    With --dry-run, only COUNT queries are run and each result reports the
+    number of rows that would be written per kind, the summary reporting their
+    total as estimated rows.
+
+    Args:
+        ctx: context
+        emails: emails of the users to be anonymized
+        input_file: file to read the emails from when no argument is given
+        output_file: file to write the per-email results to
+        chunk_size: number of users anonymized and committed together
+        field_type_cache_size: maximum number of fields whose input type is cached
+        dry_run: whether to only count the rows that would be anonymized
+        verify: how to verify the anonymization of each chunk once committed
+    """
+    field_types = FieldTypeCache(field_type_cache_size)
+    counts: typing.Counter[str] = collections.Counter()
+    estimated_rows = 0
+    for chunk in _chunked(_read_emails(emails or input_file), chunk_size):
+        if dry_run:
+            results = estimate_chunk(chunk)
+        else:
+            results = anonymize_chunk(chunk, field_types, verify)
+        for result in results:
+            click.echo(json.dumps(result), file=output_file)
+        counts.update(result["status"] for result in results)
+        report = {"processed": counts.total(), **counts}
+        if dry_run:
+            estimated_rows += sum(result.get("rows", 0) for result in results)
+            report["estimated-rows"] = estimated_rows
+        click.echo(json.dumps({"progress": report}))
+
+    if not counts:
+        click.secho("E-mail list should not be empty", fg="red")
+        ctx.exit(1)
+
+    click.echo(
+        json.dumps(
+            {
+                "summary": report,
+                "field-type-cache": field_types.stats(),
+            }
+        )
+    )
+    if counts["error"]:
+        ctx.exit(1)
+
+
+@cli.command("enqueue")
+@click.argument("emails", nargs=-1, type=str)
+@click.option(
+    "--input",
+    "-i",
+    "input_file",
+    type=click.File("r"),
+    default="-",
+    help="File to read the emails from when none is given as argument (default: stdin).",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="Number of users anonymized and committed together.",
+)
+@_verify_option
+@click.pass_context
+def enqueue_users(ctx, emails, input_file, chunk_size, verify):
+    """Queue the anonymization of many users on the Celery worker.
+
+    Emails are taken from the arguments or, when none is given, read from the
+    input file (one or more per line). A JSON object is printed with the id of
+    the job, to be given to the status command.
+
+    Args:
+        ctx: context
+        emails: emails of the users to be anonymized
+        input_file: file to read the emails from when no argument is given
+        chunk_size: number of users anonymized and committed together
+        verify: how to verify the anonymization of each chunk once committed
+    """
+    # The task module imports this one, so it can only be imported once loaded
+    from anonymize.task import (  # pylint: disable=import-outside-toplevel
+        anonymize_users_task,
+    )
+
+    email_list = list(dict.fromkeys(_read_emails(emails or input_file)))
+    if not email_list:
+        click.secho("E-mail list should not be empty", fg="red")
+        ctx.exit(1)
+    job = anonymize_users_task.delay(email_list, chunk_size=chunk_size, verify=verify)
+    click.echo(json.dumps({"job-id": job.id, "emails": len(email_list)}))
+
+
+@cli.command("status")
+@click.argument("job_id", type=str)
+@click.option(
+    "--output",
+    "-o",
+    "output_file",
+    type=click.File("w"),
+    default=None,
+    help="File to write the JSON result of each email to once the job has finished.",
+)
+def job_status(job_id, output_file):
+    """Report the status of an anonymization job queued by the enqueue command.
+
+    A JSON object is printed with the state of the job and, depending on it, the
+    progress of the job, its summary or its error. Once the job has succeeded,
+    one JSON object per email is written with its result.
+
+    Args:
+        job_id: id of the job returned by the enqueue command
+        output_file: file to write the per-email results to
+    """
+    job = AsyncResult(job_id)
+    status: typing.Dict[str, typing.Any] = {"job-id": job_id, "state": job.state}
+    if job.state == "PROGRESS":
+        status["progress"] = job.info["progress"]
+    elif job.successful():
+        for result in job.result["results"]:
+            click.echo(json.dumps(result), file=output_file)
+        status["summary"] = job.result["summary"]
+        status["field-type-cache"] = job.result["field-type-cache"]
+    elif job.failed():
+        status["error"] = repr(job.result)
+    click.echo(json.dumps(status))
+
+
+@cli.command("benchmark")
+@click.argument("emails", nargs=-1, type=str, required=True)
+@click.option(
+    "--repeat", type=click.IntRange(min=1), default=3, show_default=True, help="Rounds to run."
+)
+def benchmark(emails, repeat):
+    """Compare the registrations anonymization strategies without changing any data.
+
+    The registrations of the users of the given emails are anonymized with the
+    set-based statements and with the per-row ORM loop, each run inside a
+    savepoint that is rolled back. The mean time and number of SQL statements
+    of each strategy are printed as JSON.
+
+    Args:
+        emails: emails of the users whose registrations are anonymized
+        repeat: number of rounds to run each strategy
+    """
+    # db.session has query()
+    user_ids = db.session.query(UserEmail.user_id).filter(  # pylint: disable=no-member
+        UserEmail.email.in_([email.lower() for email in emails])
+    )
+    users = User.query.filter(User.id.in_(user_ids)).all()
+    registrations = Registration.query.filter(
+        Registration.user_id.in_([user.id for user in users])
+    ).count()
+    strategies = {"set-based": anonymize_registrations, "per-row": anonymize_registrations_per_row}
+    timings: typing.Dict[str, typing.List[float]] = collections.defaultdict(list)
+    statements: typing.Counter[str] = collections.Counter()
+    current = ""
+
+    def _count_statement(*_, **__):
+        """Count the SQL statements sent by the current strategy."""
+        statements[current] += 1
+
+    event.listen(db.engine, "before_cursor_execute", _count_statement)
+    try:
+        for _ in range(repeat):
+            for current, strategy in strategies.items():
+                # db.session has begin_nested()
+                savepoint = db.session.begin_nested()  # pylint: disable=no-member
+                start = time.perf_counter()
+                for user in users:
+                    strategy(user)
+                # db.session has flush()
+                db.session.flush()  # pylint: disable=no-member
+                timings[current].append(time.perf_counter() - start)
+                savepoint.rollback()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _count_statement)
+        # db.session has rollback()
+        db.session.rollback()  # pylint: disable=no-member
+
+    for name, durations in timings.items():
+        click.echo(
+            json.dumps(
+                {
+                    "strategy": name,
+                    "users": len(users),
+                    "registrations": registrations,
+                    "seconds": sum(durations) / len(durations),
+                    "statements": statements[name] / repeat,
+                }
+            )
+        )
@@ -13,13 +13,15 @@ from anonymize.cli import cli
 class AnonymizePlugin(IndicoPlugin):
     """Anonymize.
 
-    Provides a way to non-interactively anonymize users via Indico's CLI
+    Provides a way to non-interactively anonymize users via Indico's CLI,
+    either directly or in the background on the Celery worker
     """
 
     def init(self):
         """Construct."""
         super().init()
         self.connect(signals.plugin.cli, self._extend_indico_cli)
+        self.connect(signals.core.import_tasks, self._import_tasks)
 
     def _extend_indico_cli(self, *_, **__):
         """Return the indico extended cli.
@@ -28,3 +30,7 @@ class AnonymizePlugin(IndicoPlugin):
             Indico's CLI with extra parameters.
         """
         return cli
+
+    def _import_tasks(self, *_, **__):
+        """Register the Celery tasks of the plugin."""
+        import anonymize.task  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
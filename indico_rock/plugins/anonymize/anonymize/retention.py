@@ -0,0 +1,144 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Find the users inactive for longer than the retention period and report sweep metrics."""
+
+import dataclasses
+import datetime
+import os
+import socket
+import typing
+
+from indico.modules.auth import Identity
+from indico.modules.users import User
+from indico.util.date_time import now_utc
+
+from anonymize.cli import DEFAULT_CHUNK_SIZE
+
+# Retention settings, set from the charm configuration
+RETENTION_DAYS_ENV = "FLASK_RETENTION_DAYS"
+RETENTION_BATCH_SIZE_ENV = "FLASK_RETENTION_BATCH_SIZE"
+RETENTION_WINDOW_ENV = "FLASK_RETENTION_WINDOW"
+
+# Address of the statsd exporter running next to the workload
+STATSD_ADDRESS = ("localhost", 9125)
+
+
+@dataclasses.dataclass(frozen=True)
+class RetentionSettings:
+    """Settings of the retention sweep.
+
+    Attributes:
+        days: number of days without login after which a user is anonymized, 0 disables it
+        batch_size: number of users anonymized and committed together
+        window: UTC start and end times of the sweep, any time when unset
+    """
+
+    days: int = 0
+    batch_size: int = DEFAULT_CHUNK_SIZE
+    window: typing.Optional[typing.Tuple[datetime.time, datetime.time]] = None
+
+    @classmethod
+    def from_env(cls) -> "RetentionSettings":
+        """Read the retention settings from the environment.
+
+        Returns:
+            RetentionSettings: the retention settings
+
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        window = None
+        if window_value := os.environ.get(RETENTION_WINDOW_ENV, "").strip():
+            start, _, end = window_value.partition("-")
+            window = (datetime.time.fromisoformat(start), datetime.time.fromisoformat(end))
+        return cls(
+            days=int(os.environ.get(RETENTION_DAYS_ENV) or 0),
+            batch_size=max(1, int(os.environ.get(RETENTION_BATCH_SIZE_ENV) or DEFAULT_CHUNK_SIZE)),
+            window=window,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the retention sweep is enabled.
+
+        Returns:
+            bool: True when a retention period is set
+        """
+        return self.days > 0
+
+    def in_window(self, now: datetime.datetime) -> bool:
+        """Check whether the sweep may run at a given time.
+
+        Args:
+            now: time to check, in UTC
+
+        Returns:
+            bool: True when there is no window or the time falls inside it
+        """
+        if self.window is None:
+            return True
+        start, end = self.window
+        current = now.time().replace(tzinfo=None)
+        if start <= end:
+            return start <= current < end
+        # The window spans midnight
+        return current >= start or current < end
+
+
+def inactive_users(cutoff: datetime.datetime, after_id: int, limit: int) -> typing.List[User]:
+    """Find the users who have not logged in since a date, ordered by id.
+
+    Users who never logged in are inactive when they were created before the date.
+    Admins, system and already deleted users are never returned.
+
+    Args:
+        cutoff: date since which the users have not logged in
+        after_id: only return users whose id is greater than this one
+        limit: maximum number of users returned
+
+    Returns:
+        list: the inactive users
+    """
+    recent_login = Identity.query.filter(
+        Identity.user_id == User.id, Identity.last_login_dt >= cutoff
+    ).exists()
+    return (
+        User.query.filter(
+            User.id > after_id,
+            ~User.is_deleted,
+            ~User.is_admin,
+            ~User.is_system,
+            User.created_dt < cutoff,
+            ~recent_login,
+        )
+        .order_by(User.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def retention_cutoff(settings: RetentionSettings) -> datetime.datetime:
+    """Compute the date before which the last login of a user makes them inactive.
+
+    Args:
+        settings: the retention settings
+
+    Returns:
+        datetime: the cutoff date, in UTC
+    """
+    return now_utc() - datetime.timedelta(days=settings.days)
+
+
+def send_metrics(metrics: typing.Iterable[str]):
+    """Send metrics to the statsd exporter, ignoring any network error.
+
+    Args:
+        metrics: metrics in the DogStatsD format (e.g. `name:1|c|#tag:value`)
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for metric in metrics:
+            try:
+                sock.sendto(metric.encode(), STATSD_ADDRESS)
+            except OSError:
+                pass
@@ -0,0 +1,140 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Delete the files of anonymized users from their storage backends in batches."""
+
+import collections
+import itertools
+import typing
+
+from indico.core.storage.backend import ReadOnlyStorageMixin, StorageError, get_storage
+
+# Maximum number of keys of a single S3 DeleteObjects request
+S3_DELETE_BATCH_SIZE = 1000
+
+
+class StoredFileBatch:
+    """Files to delete from their storage backends once the anonymization is committed.
+
+    Each file is recorded along with the email of its owner so a failed deletion
+    can be reported for that email. Files stored in S3 are deleted with one
+    multi-object delete request per bucket and batch of keys, using a single
+    client per backend, other backends deleting their files one by one.
+    """
+
+    def __init__(self):
+        """Construct."""
+        # storage backend name -> list of (file id, owner email)
+        self._files: typing.DefaultDict[str, typing.List[typing.Tuple[str, str]]] = (
+            collections.defaultdict(list)
+        )
+
+    def __len__(self) -> int:
+        """Count the files waiting to be deleted.
+
+        Returns:
+            int: number of files
+        """
+        return sum(len(files) for files in self._files.values())
+
+    def add(self, backend: str, file_id: str, owner: str):
+        """Record a file to delete.
+
+        Args:
+            backend: name of the storage backend of the file
+            file_id: id of the file within the storage backend
+            owner: email of the user the file belongs to
+        """
+        self._files[backend].append((file_id, owner))
+
+    def discard(self, owner: str):
+        """Forget the files of an owner, e.g. when their anonymization was rolled back.
+
+        Args:
+            owner: email of the user the files belong to
+        """
+        for backend, files in self._files.items():
+            self._files[backend] = [(file_id, email) for file_id, email in files if email != owner]
+
+    def delete(self) -> typing.Dict[str, str]:
+        """Delete all the recorded files and forget them.
+
+        Returns:
+            dict: error message per owner email whose files could not all be deleted
+        """
+        failed: typing.Dict[str, str] = {}
+        for backend, files in self._files.items():
+            if not files:
+                continue
+            owners = dict(files)
+            try:
+                storage = get_storage(backend)
+            except RuntimeError as exc:
+                errors = dict.fromkeys(owners, str(exc))
+            else:
+                if isinstance(storage, ReadOnlyStorageMixin):
+                    errors = dict.fromkeys(owners, "read-only storage")
+                # S3 backends (from the storage_s3 plugin) expose their boto3 client
+                elif hasattr(storage, "client") and hasattr(storage, "_parse_file_id"):
+                    errors = _delete_s3_files(storage, list(owners))
+                else:
+                    errors = _delete_files(storage, list(owners))
+            for file_id, message in errors.items():
+                failed.setdefault(owners[file_id], f"Could not delete {file_id}: {message}")
+        self._files.clear()
+        return failed
+
+
+def _delete_files(storage, file_ids: typing.List[str]) -> typing.Dict[str, str]:
+    """Delete files one by one from a storage backend.
+
+    Args:
+        storage: storage backend of the files
+        file_ids: ids of the files within the storage backend
+
+    Returns:
+        dict: error message per file id that could not be deleted
+    """
+    errors = {}
+    for file_id in file_ids:
+        try:
+            storage.delete(file_id)
+        except StorageError as exc:
+            errors[file_id] = str(exc)
+    return errors
+
+
+def _delete_s3_files(storage, file_ids: typing.List[str]) -> typing.Dict[str, str]:
+    """Delete files from an S3 storage backend with multi-object delete requests.
+
+    Args:
+        storage: S3 storage backend of the files
+        file_ids: ids of the files within the storage backend
+
+    Returns:
+        dict: error message per file id that could not be deleted
+    """
+    # bucket -> key -> file id
+    keys: typing.DefaultDict[str, typing.Dict[str, str]] = collections.defaultdict(dict)
+    for file_id in file_ids:
+        bucket, key = storage._parse_file_id(file_id)  # pylint: disable=protected-access
+        keys[bucket][key] = file_id
+
+    errors = {}
+    client = storage.client
+    for bucket, bucket_keys in keys.items():
+        iterator = iter(bucket_keys)
+        while batch := list(itertools.islice(iterator, S3_DELETE_BATCH_SIZE)):
+            try:
+                response = client.delete_objects(
+                    Bucket=bucket,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                errors.update((bucket_keys[key], str(exc)) for key in batch)
+                continue
+            errors.update(
+                (bucket_keys[error["Key"]], error.get("Message", error.get("Code", "")))
+                for error in response.get("Errors", [])
+            )
+    return errors
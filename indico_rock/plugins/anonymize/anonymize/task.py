@@ -0,0 +1,164 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Anonymize users in the background on the Celery worker."""
+
+import collections
+import time
+import typing
+
+import redis
+from celery.schedules import crontab
+from indico.core.celery import celery
+from indico.core.config import config
+from indico.core.logger import Logger
+from indico.util.date_time import now_utc
+
+from anonymize.cli import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_VERIFY_MODE,
+    FieldTypeCache,
+    _chunked,
+    anonymize_chunk,
+)
+from anonymize.retention import (
+    RetentionSettings,
+    inactive_users,
+    retention_cutoff,
+    send_metrics,
+)
+
+logger = Logger.get("anonymize")
+
+# Redis key of the lock held by the running retention sweep, in the broker instance
+SWEEP_LOCK_KEY = "indico-anonymize:retention-sweep"
+# Lifetime of the lock, renewed before each batch, so a crashed sweep does not hold it forever
+SWEEP_LOCK_TIMEOUT = 30 * 60
+
+
+@celery.task(name="anonymize_users", bind=True, ignore_result=False)
+def anonymize_users_task(
+    task,
+    emails: typing.List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    verify: str = DEFAULT_VERIFY_MODE,
+) -> typing.Dict[str, typing.Any]:
+    """Anonymize many users in chunks, reporting the progress after each chunk commit.
+
+    Args:
+        task: the running Celery task
+        emails: emails of the users to be anonymized
+        chunk_size: number of users anonymized and committed together
+        verify: how to verify the anonymization of each chunk once committed
+
+    Returns:
+        dict: summary of the anonymization and result of each email
+    """
+    field_types = FieldTypeCache()
+    counts: typing.Counter[str] = collections.Counter()
+    results: typing.List[typing.Dict[str, str]] = []
+    for chunk in _chunked(emails, chunk_size):
+        chunk_results = anonymize_chunk(chunk, field_types, verify)
+        results.extend(chunk_results)
+        counts.update(result["status"] for result in chunk_results)
+        task.update_state(
+            state="PROGRESS",
+            meta={"progress": {"processed": counts.total(), "total": len(emails), **counts}},
+        )
+    return {
+        "summary": {"processed": counts.total(), **counts},
+        "field-type-cache": field_types.stats(),
+        "results": results,
+    }
+
+
+# The sweep is checked often enough to start shortly after its window opens.
+# Celery beat enqueues it every time, so a run lasting longer than the interval
+# overlaps with the next ones, which skip the sweep while it holds the lock.
+@celery.periodic_task(name="anonymize_inactive_users", run_every=crontab(minute="*/15"))
+def anonymize_inactive_users():
+    """Anonymize the users who have not logged in during the retention period.
+
+    The users are anonymized in batches, each one committed at once, until none
+    is left or the run window closes. A single sweep runs at a time, holding a
+    lock in the Redis of the Celery broker. The number of users per status, the
+    number of rows written, the number of batches and the time spent are sent
+    to the statsd exporter.
+    """
+    try:
+        settings = RetentionSettings.from_env()
+    except ValueError:
+        logger.exception("Invalid retention settings, skipping the retention sweep")
+        return
+    if not settings.enabled or not settings.in_window(now_utc()):
+        return
+
+    lock = redis.Redis.from_url(config.CELERY_BROKER).lock(
+        SWEEP_LOCK_KEY, timeout=SWEEP_LOCK_TIMEOUT
+    )
+    if not lock.acquire(blocking=False):
+        logger.info("A retention sweep is already running, skipping this one")
+        return
+    try:
+        _sweep(settings, lock)
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            logger.warning("The retention sweep lock expired before the end of the sweep")
+
+
+def _sweep(settings: RetentionSettings, lock: redis.lock.Lock):
+    """Anonymize the inactive users in batches and send the metrics of the sweep.
+
+    Args:
+        settings: the retention settings
+        lock: the lock held by the sweep, renewed before each batch
+
+    The sweep stops, still sending the metrics of the batches committed so far,
+    when the lock was lost, e.g. after a batch lasting longer than its timeout.
+    """
+    cutoff = retention_cutoff(settings)
+    field_types = FieldTypeCache()
+    counts: typing.Counter[str] = collections.Counter()
+    rows = 0
+    batches = 0
+    last_id = 0
+    start = time.monotonic()
+    # Users are paginated by id so those failing to be anonymized are not retried in the run
+    while settings.in_window(now_utc()):
+        try:
+            lock.reacquire()
+        except redis.exceptions.LockError:
+            logger.warning("The retention sweep lock was lost, stopping the sweep")
+            break
+        users = inactive_users(cutoff, last_id, settings.batch_size)
+        if not users:
+            break
+        last_id = users[-1].id
+        emails = [user.email for user in users if user.email]
+        results = anonymize_chunk(emails, field_types, DEFAULT_VERIFY_MODE)
+        counts.update(result["status"] for result in results)
+        rows += sum(result.get("rows", 0) for result in results)
+        batches += 1
+    duration = time.monotonic() - start
+
+    logger.info(
+        "Retention sweep of users inactive since %s: %d batches, %d rows in %.1fs, %s",
+        cutoff,
+        batches,
+        rows,
+        duration,
+        dict(counts),
+    )
+    send_metrics(
+        [
+            f"indico_anonymize_retention_users:{count}|c|#status:{status}"
+            for status, count in counts.items()
+        ]
+        + [
+            f"indico_anonymize_retention_rows:{rows}|c",
+            f"indico_anonymize_retention_batches:{batches}|c",
+            f"indico_anonymize_retention_duration:{duration * 1000:.0f}|ms",
+        ]
+    )
@@ -4,13 +4,37 @@
 
 """Create users non-interactively."""
 
+import collections
+import csv
+import itertools
+import json
+import secrets
+import time
+import typing
+
 import click
 from indico.cli.core import cli_group
 from indico.core.db import db
 from indico.modules.auth import Identity
 from indico.modules.users import User
+from indico.modules.users.models.emails import UserEmail
 from indico.modules.users.operations import create_user
 from indico.modules.users.util import search_users
+from sqlalchemy import String, and_, any_, bindparam, func, literal, null, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from autocreate.hashing import PasswordHasher, is_password_hash
+
+# How the creation is verified once committed: by searching the user like the
+# users search form does (each), with a single EXISTS query (batch) or not at
+# all (none).
+VERIFY_MODES = ("each", "batch", "none")
+DEFAULT_VERIFY_MODE = "batch"
+
+DEFAULT_CHUNK_SIZE = 100
+INPUT_FORMATS = ("csv", "jsonl")
+# Value of the personal fields missing from the input, as for the admin
+UNKNOWN = "unknown"
 
 
 @cli_group(name="autocreate")
@@ -21,14 +45,22 @@ def cli():
 @cli.command("admin")
 @click.argument("email", type=str)
 @click.argument("password", type=str)
+@click.option(
+    "--verify",
+    type=click.Choice(VERIFY_MODES),
+    default=DEFAULT_VERIFY_MODE,
+    show_default=True,
+    help="Verify the creation with a full user search, a single EXISTS query or not at all.",
+)
 @click.pass_context
-def create_admin(ctx, email, password) -> None:
+def create_admin(ctx, email, password, verify) -> None:
     """Create a new admin user non-interactively.
 
     Args:
         ctx: Click's CLI context passed as a parameter.
         email: Indico user's email.
         password: Indico user's password
+        verify: How to verify the creation once committed.
     """
     email = email.lower()
     username = email
@@ -36,7 +68,9 @@ def create_admin(ctx, email, password) -> None:
     last_name = "unknown"
     affiliation = "unknown"
 
-    if User.query.filter(User.all_emails == email, ~User.is_deleted, ~User.is_pending).has_rows():
+    # The email and the username are checked in a single round trip
+    emails, identities = find_conflicts({email}, {("indico", username)})
+    if emails:
         click.secho("This user already exists", fg="red")
         ctx.exit(1)
 
@@ -44,7 +78,7 @@ def create_admin(ctx, email, password) -> None:
         click.secho("Password should not be empty", fg="red")
         ctx.exit(1)
 
-    if Identity.query.filter_by(provider="indico", identifier=username).has_rows():
+    if identities:
         click.secho("Username already exists", fg="red")
         ctx.exit(1)
 
@@ -61,25 +95,392 @@ def create_admin(ctx, email, password) -> None:
     # db.session has commit()
     db.session.commit()  # pylint: disable=no-member
 
-    # search the created user
-    res = search_users(
-        exact=True,
-        include_deleted=False,
-        include_pending=False,
-        include_blocked=False,
-        external=False,
-        allow_system_user=False,
-        email=email,
-    )
-
-    if not res:
+    if verify == "batch" and not User.query.filter_by(id=user.id, is_admin=True).has_rows():
         click.secho("Admin was not correctly created", fg="red")
         ctx.exit(1)
 
-    user = res.pop()
+    if verify == "each":
+        # search the created user
+        res = search_users(
+            exact=True,
+            include_deleted=False,
+            include_pending=False,
+            include_blocked=False,
+            external=False,
+            allow_system_user=False,
+            email=email,
+        )
 
-    if not user.is_admin:
-        click.secho("Created user is not admin", fg="red")
-        ctx.exit(1)
+        if not res:
+            click.secho("Admin was not correctly created", fg="red")
+            ctx.exit(1)
+
+        user = res.pop()
+
+        if not user.is_admin:
+            click.secho("Created user is not admin", fg="red")
+            ctx.exit(1)
 
     click.secho(f'Admin with email "{user.email}" correctly created', fg="green")
+
+
+def _read_users(
+    input_file: typing.TextIO, input_format: str
+) -> typing.Iterator[typing.Dict[str, str]]:
+    """Read the users to create from a CSV file with a header or a JSON lines file.
+
+    Args:
+        input_file: file to read the users from
+        input_format: format of the file, one of INPUT_FORMATS
+
+    Yields:
+        dict: fields of the next user, or an error for an invalid line
+    """
+    if input_format == "csv":
+        for row in csv.DictReader(input_file):
+            yield {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+        return
+    for line in input_file:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield {"error": f"Invalid JSON line: {exc}"}
+            continue
+        if not isinstance(record, dict):
+            yield {"error": "Invalid JSON line: not an object"}
+            continue
+        yield {key.lower(): str(value).strip() for key, value in record.items()}
+
+
+def _identity_key(record: typing.Dict[str, str]) -> typing.Optional[typing.Tuple[str, str]]:
+    """Get the provider and identifier of the identity of a user to create.
+
+    A password, plain text or pre-hashed, gives a local identity whose username
+    defaults to the email, a provider without password an identity linked to it (e.g. SSO) whose
+    identifier defaults to the email.
+
+    Args:
+        record: fields of the user
+
+    Returns:
+        tuple: provider and identifier, or None if the user has no identity
+    """
+    if record.get("password") or record.get("password_hash"):
+        return "indico", record.get("username") or record["email"]
+    if record.get("provider"):
+        return record["provider"], record.get("identifier") or record["email"]
+    return None
+
+
+def find_conflicts(
+    emails: typing.Collection[str], identities: typing.Collection[typing.Tuple[str, str]]
+) -> typing.Tuple[typing.Set[str], typing.Set[typing.Tuple[str, str]]]:
+    """Find the emails and identities already in use for a whole batch in a single query.
+
+    The emails and identities are each sent as one array parameter, the latter
+    unnested into a derived table joined to the identities, so the statement
+    stays the same whatever the size of the batch.
+
+    Args:
+        emails: emails of the users to create
+        identities: provider and identifier of the identities of the users to create
+
+    Returns:
+        tuple: emails used by an active user, and provider and identifier of the
+            identities already linked to a user
+    """
+    if not emails and not identities:
+        return set(), set()
+    providers, identifiers = zip(*identities) if identities else ((), ())
+    candidates = select(
+        func.unnest(bindparam("providers", list(providers), type_=ARRAY(String))).label(
+            "provider"
+        ),
+        func.unnest(bindparam("identifiers", list(identifiers), type_=ARRAY(String))).label(
+            "identifier"
+        ),
+    ).subquery()
+    query = union_all(
+        select(literal("email"), UserEmail.email, null())
+        .join(User, UserEmail.user_id == User.id)
+        .where(
+            UserEmail.email == any_(bindparam("emails", list(emails), type_=ARRAY(String))),
+            ~User.is_deleted,
+            ~User.is_pending,
+        ),
+        select(literal("identity"), Identity.provider, Identity.identifier).join(
+            candidates,
+            and_(
+                Identity.provider == candidates.c.provider,
+                Identity.identifier == candidates.c.identifier,
+            ),
+        ),
+    )
+    conflicting_emails = set()
+    conflicting_identities = set()
+    # db.session has execute()
+    for kind, key, identifier in db.session.execute(query):  # pylint: disable=no-member
+        if kind == "email":
+            conflicting_emails.add(key)
+        else:
+            conflicting_identities.add((key, identifier))
+    return conflicting_emails, conflicting_identities
+
+
+def _hash_passwords(
+    records: typing.Dict[int, typing.Dict[str, str]], hasher: typing.Optional[PasswordHasher]
+) -> typing.Dict[int, str]:
+    """Hash the plain text passwords of some users at once.
+
+    Args:
+        records: fields of the users by index
+        hasher: hasher of the passwords, hashing them in the current process when unset
+
+    Returns:
+        dict: password hash by index of the users with a plain text password
+    """
+    indexes = [
+        index
+        for index, record in records.items()
+        if record.get("password") and not record.get("password_hash")
+    ]
+    password_hashes = (hasher or PasswordHasher(workers=1)).hash_many(
+        [records[index]["password"] for index in indexes]
+    )
+    return dict(zip(indexes, password_hashes))
+
+
+def _plan_chunk(
+    records: typing.List[typing.Dict[str, str]],
+    seen: typing.Set[typing.Union[str, typing.Tuple[str, str]]],
+) -> typing.Tuple[
+    typing.List[typing.Dict[str, str]],
+    typing.Dict[int, typing.Tuple[typing.Dict[str, str], typing.Optional[typing.Tuple[str, str]]]],
+]:
+    """Find the users of a chunk to create, the others being skipped or invalid.
+
+    The conflicting emails and identities of the whole chunk are checked with a
+    single query.
+
+    Args:
+        records: fields of the users to create
+        seen: emails and identities already read in the run, updated with the chunk's
+
+    Returns:
+        tuple: result of each user, and record and identity of the users to create by index
+    """
+    for record in records:
+        record["email"] = record.get("email", "").lower()
+        if record.get("password_hash") and not is_password_hash(record["password_hash"]):
+            record.setdefault("error", "Invalid password hash")
+    emails, identities = find_conflicts(
+        {record["email"] for record in records if record["email"]},
+        {key for record in records if record["email"] and (key := _identity_key(record))},
+    )
+
+    results: typing.List[typing.Dict[str, str]] = []
+    to_create = {}
+    for record in records:
+        email = record["email"]
+        key = _identity_key(record) if email else None
+        if "error" in record or not email:
+            message = record.get("error", "Missing email")
+            results.append({"email": email, "status": "error", "message": message})
+        elif email in emails or email in seen:
+            results.append({"email": email, "status": "skipped", "reason": "email-exists"})
+        elif key and (key in identities or key in seen):
+            results.append({"email": email, "status": "skipped", "reason": "identity-exists"})
+        else:
+            seen.add(email)
+            if key:
+                seen.add(key)
+            to_create[len(results)] = (record, key)
+            results.append({"email": email, "status": "created"})
+    return results, to_create
+
+
+def create_users_chunk(
+    records: typing.List[typing.Dict[str, str]],
+    seen: typing.Set[typing.Union[str, typing.Tuple[str, str]]],
+    hasher: typing.Optional[PasswordHasher] = None,
+) -> typing.List[typing.Dict[str, str]]:
+    """Create the users of a chunk and commit them together.
+
+    The conflicting emails and identities of the whole chunk are checked
+    beforehand with a single query, then the passwords of all the users to
+    create are hashed at once, across the processes of the hasher, before the
+    first user is created. Each user is created inside its own savepoint so a
+    failure only discards that user.
+
+    Args:
+        records: fields of the users to create
+        seen: emails and identities already read in the run, updated with the chunk's
+        hasher: hasher of the passwords shared by the run
+
+    Returns:
+        list: result of the creation of each user
+    """
+    results, to_create = _plan_chunk(records, seen)
+
+    # Hash all the plain text passwords of the chunk before creating any user
+    password_hashes = _hash_passwords(
+        {index: record for index, (record, _) in to_create.items()}, hasher
+    )
+
+    for index, (record, key) in to_create.items():
+        data = {
+            "first_name": record.get("first_name") or UNKNOWN,
+            "last_name": record.get("last_name") or UNKNOWN,
+            "affiliation": record.get("affiliation") or UNKNOWN,
+        }
+        identity = None
+        if key:
+            identity = Identity(provider=key[0], identifier=key[1])
+            identity.password_hash = record.get("password_hash") or password_hashes.get(index)
+        try:
+            # db.session has begin_nested()
+            with db.session.begin_nested():  # pylint: disable=no-member
+                create_user(record["email"], data, identity, from_moderation=False)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            results[index].update(status="error", message=str(exc))
+
+    # db.session has commit()
+    db.session.commit()  # pylint: disable=no-member
+    return results
+
+
+@cli.command("users")
+@click.option(
+    "--input",
+    "-i",
+    "input_file",
+    type=click.File("r"),
+    default="-",
+    help="File to read the users from (default: stdin).",
+)
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(INPUT_FORMATS),
+    default="csv",
+    show_default=True,
+    help="Format of the input: CSV with a header line or one JSON object per line.",
+)
+@click.option(
+    "--output",
+    "-o",
+    "output_file",
+    type=click.File("a"),
+    default=None,
+    help="File to append the JSON result of each user to instead of printing it.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="Number of users created and committed together.",
+)
+@click.option(
+    "--hash-workers",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Number of processes hashing the passwords, 0 for all the available cores.",
+)
+@click.pass_context
+def create_users(  # pylint: disable=too-many-arguments
+    ctx, input_file, input_format, output_file, chunk_size, hash_workers
+):
+    """Create many users non-interactively in a single process.
+
+    Each user has an email and optionally a first name, last name and
+    affiliation. A password creates a local identity whose username defaults to
+    the email; a provider without password (e.g. SSO) creates an identity with
+    that provider whose identifier defaults to the email. Users whose email or
+    identity already exists are skipped. A `password_hash` field holding a bcrypt
+    hash can be given instead of the plain text password.
+
+    The users are streamed in chunks of fixed size, each one committed in a
+    single transaction. One JSON object per user is written with its result,
+    followed after each chunk by a JSON progress line and at the end by a JSON
+    summary. The plain text passwords of each chunk are hashed in a pool of
+    processes before the users are created.
+
+    Args:
+        ctx: context
+        input_file: file to read the users from
+        input_format: format of the input file, one of INPUT_FORMATS
+        output_file: file to write the per-user results to
+        chunk_size: number of users created and committed together
+        hash_workers: number of processes hashing the passwords
+    """
+    counts: typing.Counter[str] = collections.Counter()
+    seen: typing.Set[typing.Union[str, typing.Tuple[str, str]]] = set()
+    records = _read_users(input_file, input_format)
+    with PasswordHasher(hash_workers) as hasher:
+        while chunk := list(itertools.islice(records, chunk_size)):
+            results = create_users_chunk(chunk, seen, hasher)
+            for result in results:
+                click.echo(json.dumps(result), file=output_file)
+            counts.update(result["status"] for result in results)
+            click.echo(json.dumps({"progress": {"processed": counts.total(), **counts}}))
+
+    if not counts:
+        click.secho("User list should not be empty", fg="red")
+        ctx.exit(1)
+
+    click.echo(json.dumps({"summary": {"processed": counts.total(), **counts}}))
+    if counts["error"]:
+        ctx.exit(1)
+
+
+@cli.command("benchmark")
+@click.option(
+    "--users",
+    "count",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Number of passwords hashed for each number of processes.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    "workers",
+    type=click.IntRange(min=0),
+    multiple=True,
+    default=(1, 4, 0),
+    show_default=True,
+    help="Number of processes hashing the passwords, 0 for all the available cores.",
+)
+def benchmark(count, workers):
+    """Measure how many users per second get their password hashed before creation.
+
+    Hashing the passwords is the CPU bound part of the user creation. One JSON
+    line is printed per number of processes, without touching the database.
+
+    Args:
+        count: number of passwords hashed for each number of processes
+        workers: numbers of processes to measure
+    """
+    passwords = [secrets.token_urlsafe(16) for _ in range(count)]
+    for requested in workers:
+        with PasswordHasher(requested) as hasher:
+            # The processes are started before measuring
+            hasher.hash_many(passwords[: hasher.workers])
+            start = time.perf_counter()
+            hasher.hash_many(passwords)
+            elapsed = time.perf_counter() - start
+        click.echo(
+            json.dumps(
+                {
+                    "workers": hasher.workers,
+                    "users": count,
+                    "seconds": round(elapsed, 3),
+                    "users-per-second": round(count / elapsed, 1),
+                }
+            )
+        )
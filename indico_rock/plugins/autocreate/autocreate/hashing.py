@@ -0,0 +1,106 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Hash the passwords of the users to create on several cores."""
+
+import multiprocessing
+import os
+import re
+import typing
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+import bcrypt
+
+# Format of the bcrypt hashes accepted as pre-hashed passwords
+BCRYPT_HASH_RE = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+
+
+def hash_password(password: str) -> str:
+    """Hash a password like Indico's BCryptPassword does for the local identities.
+
+    Args:
+        password: the plain text password
+
+    Returns:
+        str: the bcrypt hash of the password
+    """
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+
+def is_password_hash(value: str) -> bool:
+    """Check that a pre-hashed password is a bcrypt hash Indico can verify.
+
+    Args:
+        value: the pre-hashed password
+
+    Returns:
+        bool: True if the value is a bcrypt hash
+    """
+    return bool(BCRYPT_HASH_RE.match(value))
+
+
+def resolve_workers(workers: int) -> int:
+    """Get the number of processes hashing the passwords.
+
+    Args:
+        workers: requested number of processes, 0 for all the available cores
+
+    Returns:
+        int: the number of processes
+    """
+    if workers:
+        return workers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class PasswordHasher:
+    """Hash batches of passwords in a pool of processes kept for a whole run.
+
+    The processes are spawned rather than forked so they do not inherit the
+    DB connections of the command, and only import this module. With a single
+    worker, the passwords are hashed in the current process.
+    """
+
+    def __init__(self, workers: int = 0):
+        """Construct.
+
+        Args:
+            workers: number of processes, 0 for all the available cores
+        """
+        self.workers = resolve_workers(workers)
+        self._executor: typing.Optional[Executor] = None
+
+    def __enter__(self) -> "PasswordHasher":
+        """Start the pool of processes.
+
+        Returns:
+            PasswordHasher: the hasher
+        """
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self
+
+    def __exit__(self, *_):
+        """Stop the pool of processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def hash_many(self, passwords: typing.List[str]) -> typing.List[str]:
+        """Hash some passwords, spread evenly across the processes.
+
+        Args:
+            passwords: the plain text passwords
+
+        Returns:
+            list: the bcrypt hash of each password, in the same order
+        """
+        if self._executor is None:
+            return [hash_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._executor.map(hash_password, passwords, chunksize=chunksize))
@@ -0,0 +1,71 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""SQLAlchemy plugin applying the pool settings Indico does not expose."""
+
+from sqlalchemy.engine import CreateEnginePlugin
+from sqlalchemy.pool import NullPool
+from sqlalchemy.util import asbool
+
+# Parameters of the plugin in the query of the database URL
+PLUGIN_PARAMS = ("pool_pre_ping", "pgbouncer")
+# Arguments of create_engine only accepted by the pools keeping connections open
+POOL_ARGS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping")
+
+
+class PoolPlugin(CreateEnginePlugin):
+    """Enable the pre-ping of the pooled connections or the PgBouncer mode.
+
+    Enabled with `plugin=dbpool` in the database URL, which also carries the
+    `pool_pre_ping` and `pgbouncer` boolean parameters.
+
+    In PgBouncer mode, the server connections are pooled by PgBouncer in
+    transaction pooling mode, shared by all the processes of all the units, and
+    the process does not keep any connection open: each checkout opens a new
+    connection to PgBouncer, closed when returned (NullPool), and no statement
+    is prepared on the server, as the next transaction may run on another server
+    connection.
+    """
+
+    def __init__(self, url, kwargs):
+        """Construct.
+
+        Args:
+            url: the database URL
+            kwargs: the arguments of create_engine, updated in place
+        """
+        super().__init__(url, kwargs)
+        self.pool_pre_ping = asbool(url.query.get("pool_pre_ping", False))
+        self.pgbouncer = asbool(url.query.get("pgbouncer", False))
+        self._kwargs = kwargs
+        if self.pgbouncer:
+            kwargs["poolclass"] = NullPool
+            for name in POOL_ARGS:
+                kwargs.pop(name, None)
+        elif self.pool_pre_ping:
+            kwargs["pool_pre_ping"] = True
+
+    def update_url(self, url):
+        """Remove the parameters of the plugin from the database URL.
+
+        Args:
+            url: the database URL
+
+        Returns:
+            the database URL passed to the driver
+        """
+        return url.difference_update_query(PLUGIN_PARAMS)
+
+    def handle_dialect_kwargs(self, dialect_cls, dialect_args):
+        """Disable the server-side prepared statements in PgBouncer mode.
+
+        Only psycopg (3) prepares statements on the server, psycopg2, the driver
+        of Indico, always sends the full query.
+
+        Args:
+            dialect_cls: class of the dialect
+            dialect_args: arguments of the dialect
+        """
+        if self.pgbouncer and dialect_cls.driver == "psycopg":
+            connect_args = self._kwargs.setdefault("connect_args", {})
+            connect_args["prepare_threshold"] = None
@@ -0,0 +1,8 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Tunes the SQLAlchemy connection pool of Indico from the charm configuration."""
+
+from setuptools import setup
+
+setup()
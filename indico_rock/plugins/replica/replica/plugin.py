@@ -0,0 +1,42 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Route the database reads of safe requests to the read replicas."""
+
+import os
+
+from indico.core.db import db
+from indico.core.plugins import IndicoPlugin
+
+from replica.routing import ReplicaRouter, ReplicaRoutingMixin
+
+
+class ReplicaPlugin(IndicoPlugin):
+    """Read replicas.
+
+    Sends the reads of the GET requests to some endpoints to the PostgreSQL
+    read replicas, as configured by the charm
+    """
+
+    def init(self):
+        """Construct."""
+        super().init()
+        uris = os.environ.get("POSTGRESQL_DB_READ_ONLY_URIS", "").split(",")
+        uris = [uri for uri in uris if uri]
+        if os.environ.get("FLASK_DB_READ_REPLICAS") != "true" or not uris:
+            return
+        router = ReplicaRouter.from_uris(
+            uris,
+            primary_uri=self.app.config["SQLALCHEMY_DATABASE_URI"],
+            engine_options=self.app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+            endpoints=os.environ.get("FLASK_DB_REPLICA_ENDPOINTS", "").split(),
+            max_lag=int(os.environ.get("FLASK_DB_REPLICA_MAX_LAG", "10")),
+        )
+        session_factory = db.session.session_factory
+        session_factory.class_ = type(
+            "ReplicaRoutingSession",
+            (ReplicaRoutingMixin, session_factory.class_),
+            {"router": router},
+        )
+        # The session of the current thread, if any, was made by the former class
+        db.session.remove()
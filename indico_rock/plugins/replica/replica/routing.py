@@ -0,0 +1,236 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Bind the reads of the safe requests to a read replica of the database."""
+
+import random
+import threading
+import time
+import typing
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+
+# Interval between two checks of the replication lag of a replica, in seconds
+LAG_CHECK_INTERVAL = 5
+# Replication lag of a replica, 0 when it has replayed everything it received
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+# Timeout of the connections to a replica, in seconds, bounding the lag check of
+# an unreachable replica, run while serving a request
+REPLICA_CONNECT_TIMEOUT = 2
+# Timeout of the statements run on a replica, in milliseconds
+REPLICA_STATEMENT_TIMEOUT = 30000
+# Key of the Flask session holding the time until which the user reads from the primary
+PRIMARY_UNTIL_KEY = "replica_primary_until"
+# Key of the SQLAlchemy session info set once the session wrote to the primary
+PINNED_KEY = "replica_pinned"
+
+
+class Replica:
+    """A read replica, with its engine created on first use in each process."""
+
+    def __init__(self, uri: str, engine_options: typing.Dict[str, typing.Any]):
+        """Construct.
+
+        Args:
+            uri: URI of the replica, taking the query of the primary URI
+            engine_options: the arguments of create_engine
+        """
+        self.uri = uri
+        self._engine_options = engine_options
+        self._engine = None
+        self._lock = threading.Lock()
+        self._checked_at = -LAG_CHECK_INTERVAL
+        self._healthy = False
+
+    @property
+    def engine(self):
+        """Get the engine of the replica.
+
+        Returns:
+            the SQLAlchemy engine
+        """
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = create_engine(self.uri, **self._engine_options)
+        return self._engine
+
+    def is_healthy(self, max_lag: int) -> bool:
+        """Check that the replica is reachable and not lagging too far behind.
+
+        The lag is queried at most once per LAG_CHECK_INTERVAL, the result of
+        the last check being used in between.
+
+        Args:
+            max_lag: maximum replication lag, in seconds
+
+        Returns:
+            bool: True if the replica can serve reads
+        """
+        now = time.monotonic()
+        if now - self._checked_at < LAG_CHECK_INTERVAL:
+            return self._healthy
+        if not self._lock.acquire(blocking=False):
+            # Another thread is checking it
+            return self._healthy
+        try:
+            self._checked_at = now
+            with self.engine.connect() as connection:
+                lag = connection.execute(LAG_QUERY).scalar()
+            self._healthy = lag is not None and lag <= max_lag
+        except SQLAlchemyError:
+            self._healthy = False
+        finally:
+            self._lock.release()
+        return self._healthy
+
+
+class ReplicaRouter:
+    """Choose the engine of the queries of a session."""
+
+    def __init__(
+        self,
+        replicas: typing.List[Replica],
+        endpoints: typing.Iterable[str],
+        max_lag: int,
+    ):
+        """Construct.
+
+        Args:
+            replicas: the read replicas
+            endpoints: the Flask endpoints whose GET requests may read from the replicas
+            max_lag: maximum replication lag of the replicas, in seconds
+        """
+        self.replicas = replicas
+        self.endpoints = frozenset(endpoints)
+        self.max_lag = max_lag
+
+    @classmethod
+    def from_uris(
+        cls,
+        uris: typing.Iterable[str],
+        primary_uri: str,
+        engine_options: typing.Dict[str, typing.Any],
+        endpoints: typing.Iterable[str],
+        max_lag: int,
+    ) -> "ReplicaRouter":
+        """Create a router for the replicas at some URIs.
+
+        The replicas are connected to like the primary, with the query of its
+        URI (e.g. the parameters of the dbpool plugin) and the same pool options,
+        with a connection timeout of REPLICA_CONNECT_TIMEOUT and a statement
+        timeout of REPLICA_STATEMENT_TIMEOUT.
+
+        Args:
+            uris: URIs of the replicas
+            primary_uri: URI of the primary
+            engine_options: the arguments of create_engine of the primary
+            endpoints: the Flask endpoints whose GET requests may read from the replicas
+            max_lag: maximum replication lag of the replicas, in seconds
+
+        Returns:
+            ReplicaRouter: the router
+        """
+        query = make_url(primary_uri).query
+        connect_args = dict(engine_options.get("connect_args", {}))
+        connect_args.setdefault("connect_timeout", REPLICA_CONNECT_TIMEOUT)
+        options = connect_args.get("options", "")
+        connect_args["options"] = f"{options} -c statement_timeout={REPLICA_STATEMENT_TIMEOUT}"
+        engine_options = {**engine_options, "connect_args": connect_args}
+        replicas = [
+            Replica(str(make_url(uri).update_query_dict(query)), engine_options) for uri in uris
+        ]
+        return cls(replicas, endpoints, max_lag)
+
+    def can_read_from_replica(self, db_session, clause) -> bool:
+        """Check that a query of a session can run on a replica.
+
+        Only the plain SELECT statements of the GET and HEAD requests to the
+        allowed endpoints run on a replica, as long as the session did not
+        write and the user did not write recently.
+
+        Args:
+            db_session: the SQLAlchemy session
+            clause: the statement to run
+
+        Returns:
+            bool: True if the query can run on a replica
+        """
+        if db_session.info.get(PINNED_KEY) or not has_request_context():
+            return False
+        if request.method not in ("GET", "HEAD") or request.endpoint not in self.endpoints:
+            return False
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        return session.get(PRIMARY_UNTIL_KEY, 0) < time.time()
+
+    def request_replica(self) -> typing.Optional[Replica]:
+        """Get the replica serving the reads of the current request.
+
+        A healthy replica is picked at random once per request, so all the
+        reads of a request see the same snapshot of the replication.
+
+        Returns:
+            the replica, or None if none is healthy
+        """
+        if "db_replica" not in g:
+            healthy = [replica for replica in self.replicas if replica.is_healthy(self.max_lag)]
+            g.db_replica = random.choice(healthy) if healthy else None
+        return g.db_replica
+
+    def on_write(self, db_session, flushing: bool):
+        """Send the following queries of a session to the primary.
+
+        When the session flushes changes, or the request is not a GET one, the
+        queries of the user's next requests also go to the primary for the
+        maximum replication lag, so they see the writes.
+
+        Args:
+            db_session: the SQLAlchemy session
+            flushing: whether the session is flushing changes
+        """
+        db_session.info[PINNED_KEY] = True
+        if (
+            has_request_context()
+            and (flushing or request.method not in ("GET", "HEAD"))
+            # Not saved again for each flush of the request
+            and session.get(PRIMARY_UNTIL_KEY, 0) < time.time() + self.max_lag - 1
+        ):
+            session[PRIMARY_UNTIL_KEY] = time.time() + self.max_lag
+
+
+class ReplicaRoutingMixin:
+    """Session mixin sending the reads allowed by the router to a replica."""
+
+    router: ReplicaRouter
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Select the engine of a query.
+
+        Args:
+            mapper: the mapper of the query
+            clause: the statement of the query
+            bind: the engine or connection explicitly requested
+            kwargs: passthrough to the session
+
+        Returns:
+            the engine or connection
+        """
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return primary
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self.router.on_write(self, self._flushing)
+            return primary
+        if self.router.can_read_from_replica(self, clause):
+            replica = self.router.request_replica()
+            if replica is not None:
+                return replica.engine
+        return primary
@@ -0,0 +1,8 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Sends the database reads of safe requests to the PostgreSQL read replicas."""
+
+from setuptools import setup
+
+setup()
@@ -0,0 +1,95 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Measure the memory and throughput of the proxied S3 downloads."""
+
+import resource
+import time
+import typing
+
+from flask import Flask
+from indico_storage_s3.storage import ProxyDownloadsMode, S3Storage
+
+from s3stream.storage import StreamingS3Storage
+
+# Download modes measured: the upstream proxy reading the whole object in
+# memory, the streamed one and a streamed download resumed from the middle
+MODES = ("buffered", "streaming", "resumed")
+MIB = 1024 * 1024
+
+
+class RepeatedReader:
+    """File object reading a block of bytes repeated up to a size, to upload a large object."""
+
+    def __init__(self, block: bytes, size: int):
+        """Construct.
+
+        Args:
+            block: the repeated block
+            size: total number of bytes read
+        """
+        self._block = block
+        self._remaining = size
+
+    def read(self, size: int = -1) -> bytes:
+        """Read some bytes.
+
+        Args:
+            size: maximum number of bytes read, -1 for all the remaining ones
+
+        Returns:
+            bytes: the bytes read, empty once all were read
+        """
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = (self._block * (size // len(self._block) + 1))[:size]
+        self._remaining -= size
+        return data
+
+
+def max_rss_mib() -> float:
+    """Get the peak resident memory of the current process.
+
+    Returns:
+        float: the peak RSS, in MiB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode: str, backend_data: str, file_id: str, size: int) -> typing.Dict[str, typing.Any]:
+    """Download an S3 object through the proxy of the storage backend, discarding it.
+
+    Run in a process of its own so the peak RSS only covers this download.
+
+    Args:
+        mode: the download mode, one of MODES
+        backend_data: the data of the S3 storage backend in STORAGE_BACKENDS
+        file_id: ID of the object in the storage
+        size: size of the object, in bytes
+
+    Returns:
+        dict: the measures of the download
+    """
+    storage = StreamingS3Storage(backend_data)
+    storage.proxy_downloads = ProxyDownloadsMode.local
+    send_file = S3Storage.send_file if mode == "buffered" else StreamingS3Storage.send_file
+    headers = {"Range": f"bytes={size // 2}-"} if mode == "resumed" else {}
+    app = Flask(__name__)
+    rss_before = max_rss_mib()
+    start = time.perf_counter()
+    with app.test_request_context(headers=headers):
+        response = send_file(storage, file_id, "application/octet-stream", "benchmark.bin", False)
+    received = 0
+    for chunk in response.iter_encoded():
+        received += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "status": response.status_code,
+        "bytes": received,
+        "seconds": round(elapsed, 3),
+        "mib-per-second": round(received / MIB / elapsed, 1),
+        "rss-before-mib": round(rss_before, 1),
+        "max-rss-mib": round(max_rss_mib(), 1),
+    }
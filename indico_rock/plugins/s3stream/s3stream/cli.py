@@ -0,0 +1,85 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark the proxied S3 downloads."""
+
+import json
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from indico.cli.core import cli_group
+from indico.core.config import config
+from indico.core.storage.backend import get_storage
+from indico_storage_s3.storage import S3Storage
+
+from s3stream.benchmark import MIB, MODES, RepeatedReader, measure
+
+
+@cli_group(name="s3stream")
+def cli():
+    """Stream the proxied S3 downloads."""
+
+
+@cli.command("benchmark")
+@click.option(
+    "--backend",
+    default="s3",
+    show_default=True,
+    help="Name of the S3 storage backend in STORAGE_BACKENDS.",
+)
+@click.option(
+    "--size",
+    type=click.IntRange(min=1),
+    default=1024,
+    show_default=True,
+    help="Size of the object uploaded for the benchmark, in MiB.",
+)
+@click.option(
+    "--key",
+    default=None,
+    help="Key of an existing object to download instead of uploading one.",
+)
+@click.option(
+    "--mode",
+    "-m",
+    "modes",
+    type=click.Choice(MODES),
+    multiple=True,
+    default=MODES,
+    show_default=True,
+    help="Download modes to measure.",
+)
+def benchmark(backend, size, key, modes):
+    """Measure the peak memory and throughput of the downloads proxied from S3.
+
+    An object of `--size` MiB is uploaded to the bucket, unless `--key` is set,
+    and downloaded once per mode in a new process, the data being discarded.
+    One JSON line is printed per mode, the uploaded object is deleted at the end.
+
+    Args:
+        backend: name of the S3 storage backend
+        size: size of the uploaded object, in MiB
+        key: key of an existing object
+        modes: download modes to measure
+    """
+    storage = get_storage(backend)
+    if not isinstance(storage, S3Storage):
+        raise click.UsageError(f"{backend} is not an S3 storage backend")
+    backend_data = config.STORAGE_BACKENDS[backend].split(":", 1)[1]
+    bucket = storage.bucket_name
+    uploaded = key is None
+    if uploaded:
+        key = f"s3stream-benchmark/{uuid.uuid4()}"
+        storage.client.upload_fileobj(RepeatedReader(os.urandom(MIB), size * MIB), bucket, key)
+    try:
+        object_size = storage.client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        for mode in modes:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(measure, mode, backend_data, key, object_size).result()
+            click.echo(json.dumps(result))
+    finally:
+        if uploaded:
+            storage.client.delete_object(Bucket=bucket, Key=key)
@@ -0,0 +1,40 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Provide the streaming S3 storage backend and its benchmark to Indico."""
+
+from indico.core import signals
+from indico.core.plugins import IndicoPlugin
+
+from s3stream.cli import cli
+from s3stream.storage import StreamingS3Storage
+
+
+class S3StreamPlugin(IndicoPlugin):
+    """S3 streaming.
+
+    Provides the `s3stream` storage backend, streaming the downloads proxied
+    from S3, and `indico s3stream benchmark` measuring them
+    """
+
+    def init(self):
+        """Construct."""
+        super().init()
+        self.connect(signals.core.get_storage_backends, self._get_storage_backends)
+        self.connect(signals.plugin.cli, self._extend_indico_cli)
+
+    def _get_storage_backends(self, *_, **__):
+        """Provide the storage backends.
+
+        Yields:
+            the streaming S3 storage backend
+        """
+        yield StreamingS3Storage
+
+    def _extend_indico_cli(self, *_, **__):
+        """Return the indico extended cli.
+
+        Returns:
+            Indico's CLI with extra parameters.
+        """
+        return cli
@@ -0,0 +1,167 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""S3 storage backend streaming the proxied downloads."""
+
+from flask import current_app, request
+from indico.core.storage import StorageError
+from indico.web.flask.util import get_safe_file_csp, should_inline_file
+from indico_storage_s3.storage import ProxyDownloadsMode, S3Storage
+from indico_storage_s3.util import make_content_disposition_args
+from werkzeug.datastructures import ContentRange, Headers
+from werkzeug.exceptions import (
+    HTTPException,
+    PreconditionFailed,
+    RequestedRangeNotSatisfiable,
+)
+from werkzeug.http import unquote_etag
+
+# Size of the chunks read from S3 and written to the client
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_body(body, chunk_size: int = CHUNK_SIZE):
+    """Read the body of an S3 object in chunks, closing it once done or interrupted.
+
+    Args:
+        body: the streaming body of the S3 object
+        chunk_size: size of the chunks
+
+    Yields:
+        bytes: the chunks of the body
+    """
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+
+def send_object(client, bucket: str, key: str, content_type: str, filename: str, inline=True):
+    """Send an S3 object to the client of the current request, streamed from S3.
+
+    The object is sent in chunks of CHUNK_SIZE, as it is read from S3, so the
+    memory used does not depend on its size. Its ETag and last modification
+    time are passed along for the conditional requests, evaluated in the order
+    of RFC 9110: a 412 when If-Match or If-Unmodified-Since fail, and a 304 when
+    the client has it already. A single byte range can be requested, only this
+    range being then read from S3, e.g. to resume a download. Requests for
+    several ranges, not supported, get the whole object.
+
+    Args:
+        client: the S3 client
+        bucket: the bucket of the object
+        key: the key of the object
+        content_type: the MIME type of the object
+        filename: the name of the file downloaded by the client
+        inline: whether the client should display the file rather than save it
+
+    Returns:
+        the response
+
+    Raises:
+        PreconditionFailed: if If-Match or If-Unmodified-Since do not match the object
+        RequestedRangeNotSatisfiable: if the requested range is not in the object
+    """
+    head = client.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    etag, _ = unquote_etag(head["ETag"])
+    last_modified = head["LastModified"]
+
+    headers = Headers()
+    disposition = "inline" if should_inline_file(content_type, inline) else "attachment"
+    headers.add("Content-Disposition", disposition, **make_content_disposition_args(filename))
+    headers["Content-Security-Policy"] = get_safe_file_csp()
+    response = current_app.response_class(
+        mimetype=content_type, headers=headers, direct_passthrough=True
+    )
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.accept_ranges = "bytes"
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    # HTTP dates have no microseconds
+    last_modified_date = last_modified.replace(microsecond=0)
+    if request.if_match:
+        if not request.if_match.contains(etag):
+            raise PreconditionFailed()
+    elif (
+        request.if_unmodified_since is not None
+        and last_modified_date > request.if_unmodified_since
+    ):
+        raise PreconditionFailed()
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (
+            request.if_modified_since is not None
+            and last_modified_date <= request.if_modified_since
+        )
+    if not_modified:
+        response.status_code = 304
+        return response
+
+    start, stop = 0, size
+    # The range is ignored when in another unit, when several ranges are
+    # requested, which RFC 9110 lets the server do, or when If-Range no longer
+    # matches the object, its ETag being compared as is as weak ones never match
+    if (
+        request.range is not None
+        and request.range.units == "bytes"
+        and len(request.range.ranges) == 1
+        and size
+        and (
+            "If-Range" not in request.headers
+            or request.headers["If-Range"] == head["ETag"]
+            or request.if_range.date == last_modified_date
+        )
+    ):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            raise RequestedRangeNotSatisfiable(length=size)
+        start, stop = byte_range
+        response.status_code = 206
+        response.content_range = ContentRange("bytes", start, stop, size)
+    response.content_length = stop - start
+    if request.method == "HEAD" or start == stop:
+        return response
+    # The object read is the one described above, even if replaced in between
+    s3_object = client.get_object(
+        Bucket=bucket, Key=key, IfMatch=head["ETag"], Range=f"bytes={start}-{stop - 1}"
+    )
+    response.response = iter_body(s3_object["Body"])
+    return response
+
+
+class StreamingS3Storage(S3Storage):
+    """S3 storage whose proxied downloads are streamed.
+
+    Used like the `s3` backend, with `s3stream:` in STORAGE_BACKENDS. The
+    downloads that are not proxied are still redirected to S3.
+    """
+
+    name = "s3stream"
+
+    def send_file(self, file_id, content_type, filename, inline=True):
+        """Send a file to the client, streamed from S3 when proxied.
+
+        Args:
+            file_id: the ID of the file in the storage
+            content_type: the MIME type of the file
+            filename: the name of the file downloaded by the client
+            inline: whether the client should display the file rather than save it
+
+        Returns:
+            the response
+
+        Raises:
+            StorageError: if the file cannot be read from S3
+        """
+        if self.proxy_downloads != ProxyDownloadsMode.local:
+            return super().send_file(file_id, content_type, filename, inline=inline)
+        bucket, key = self._parse_file_id(file_id)
+        try:
+            return send_object(self.client, bucket, key, content_type, filename, inline)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            raise StorageError(f'Could not send file "{file_id}": {exc}') from exc
@@ -0,0 +1,8 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Streams the proxied S3 downloads of Indico with range and conditional requests."""
+
+from setuptools import setup
+
+setup()
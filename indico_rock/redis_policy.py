@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Set the maxmemory policy of a Redis instance used by Indico.
+
+Usage: redis_policy.py <redis-url> <policy>
+
+The policy only lasts until the Redis server restarts, the charm sets it again
+whenever the Redis relations or the policies change. Exits with 1 when the
+server refuses it, e.g. when the CONFIG command is disabled.
+"""
+
+import sys
+import typing
+
+import redis
+
+
+def set_policy(url: str, policy: str) -> bool:
+    """Set the maxmemory policy of a Redis instance if it differs.
+
+    Args:
+        url: URL of the Redis instance
+        policy: the maxmemory policy
+
+    Returns:
+        bool: True if the instance has the policy
+    """
+    client = redis.from_url(url, socket_timeout=10)
+    try:
+        if client.config_get("maxmemory-policy").get("maxmemory-policy") != policy:
+            client.config_set("maxmemory-policy", policy)
+    except redis.RedisError as exc:
+        print(f"Cannot set the maxmemory-policy of {url}: {exc}", file=sys.stderr)
+        return False
+    finally:
+        client.close()
+    return True
+
+
+def main(argv: typing.List[str]) -> int:
+    """Set the maxmemory policy of a Redis instance.
+
+    Args:
+        argv: the command line arguments
+
+    Returns:
+        int: the exit code, 1 when the policy cannot be set
+    """
+    if len(argv) != 2:
+        print(__doc__.strip().splitlines()[2], file=sys.stderr)
+        return 2
+    return 0 if set_policy(*argv) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -10,14 +10,30 @@
 #   3. points Indico at the bundled `/srv/indico/indico.conf`;
 #   4. execs the real service command passed as positional args.
 #
-# Concurrent service starts are serialized with `flock` so the three
-# services (web/worker/scheduler) can never race the same `pip install`.
+# The plugins are installed once by the one-shot `indico-plugins-worker`
+# Pebble service (`start-indico.sh --install-plugins`), which exits once they
+# are installed. The other services start after it with `--wait-plugins`:
+# they only wait for the installed plugins to match the requested ones, then
+# all start at once, and install the plugins themselves if this takes longer
+# than $PLUGIN_INSTALL_WAIT seconds. Without any option (e.g. for the
+# migrations), the plugins are installed first when needed. Concurrent
+# installs are serialized with `flock` so they can never race the same
+# `pip install`.
 #
 # Plugins are installed with `pip install --user` (PYTHONUSERBASE set to the
 # plugin dir) rather than `--target`, so packages already baked into the image
 # (indico itself and its dependency tree) are reused instead of being
 # re-downloaded/re-compiled. An `indico==` constraint pins the Indico version
-# so a plugin can never drag in a different Indico release.
+# so a plugin can never drag in a different Indico release; the version is
+# recorded when the rock is built, so it is not looked up with `pip freeze`.
+# The time taken by each install phase is logged on stderr as JSON lines.
+#
+# The time taken to check (and wait for) the plugins is also logged for every
+# service, and passed on to `app.py` to be reported as a startup phase, along
+# with the start time of the wrapper (INDICO_STARTUP_*_MS). For the web service,
+# these are only reported by the first process importing `app.py`, which
+# removes the marker file of the wrapper (INDICO_STARTUP_MARKER), so the
+# workers respawned later by Gunicorn do not report them again.
 #
 # `--no-deps` is used because the Canonical Indico plugins are designed to
 # layer on top of the already-installed Indico dependency tree; some pin a
@@ -27,6 +43,23 @@
 # conflict. Installing --no-deps reuses the baked deps and matches how these
 # plugins were previously baked into the rock at build time.
 #
+# The plugins are built into wheels once per plugin set, package index and
+# Indico version, in a content-addressed wheelhouse that is kept on the
+# optional `plugin-wheels` storage when attached, and in the container
+# otherwise. A new pod, whose plugin dir starts empty, then installs the plugins
+# from the cached wheels with `--no-index`, without any network access. When
+# the wheelhouse is not writable, the wheels are built in the plugin dir and
+# only used once.
+#
+# With the `plugin-bundle` option and the s3 relation, the plugins are only
+# built by the leader unit (INDICO_PLUGIN_BUNDLE_BUILDER, set by the charm),
+# which uploads its installed site-packages as a tarball to the bucket (see
+# `plugin_bundle.py`). The other units download and unpack it, waiting for it
+# to be uploaded, and only build the plugins themselves when it does not show
+# up in time. The generation of the plugins (INDICO_PLUGINS_GENERATION), bumped
+# by the `refresh-external-resources` action, is part of the plugin hash, so a
+# refresh builds a new bundle instead of downloading the previous one.
+#
 # `--break-system-packages` is required because the rock base (ubuntu@24.04)
 # ships an externally-managed (PEP 668) Python; without it `pip install --user`
 # aborts. We only ever write into the per-user plugin dir, never system files.
@@ -39,41 +72,172 @@ STATE_FILE="${PLUGIN_DIR}/.installed"
 # `pip install --user` with this base installs into
 # ${PLUGIN_DIR}/lib/python3.12/site-packages.
 PLUGIN_SITE="${PLUGIN_DIR}/lib/python3.12/site-packages"
+WHEELHOUSE="${WHEELHOUSE:-/srv/indico/wheelhouse}"
+PLUGIN_BUNDLE="${PLUGIN_BUNDLE:-/srv/indico/plugin_bundle.py}"
+# `indico==<version>` constraint recorded at rock build time.
+INDICO_CONSTRAINTS="${INDICO_CONSTRAINTS:-/srv/indico/indico-constraints.txt}"
 
 export PYTHONUSERBASE="${PLUGIN_DIR}"
 
+STARTUP_STARTED_MS=$(date +%s%3N)
+
 mkdir -p "${PLUGIN_SITE}"
 
+# Logs how long a phase took since its start time, in milliseconds, as a JSON
+# line on stderr, e.g. `report_phase plugin-install wheels "${START}"`.
+report_phase() {
+    PHASE_MS=$(($(date +%s%3N) - $3))
+    printf '{"event": "%s", "phase": "%s", "seconds": %d.%03d}\n' \
+        "$1" "$2" $((PHASE_MS / 1000)) $((PHASE_MS % 1000)) >&2
+}
+
+# Runs a single command and logs how long it took as the given install phase.
+# Only used for plain commands, as `set -e` does not apply to its command.
+timed() {
+    TIMED_PHASE="$1"
+    shift
+    TIMED_START=$(date +%s%3N)
+    TIMED_STATUS=0
+    "$@" || TIMED_STATUS=$?
+    report_phase plugin-install "${TIMED_PHASE}" "${TIMED_START}"
+    return "${TIMED_STATUS}"
+}
+
+# Writes the constraint pinning the installed Indico version, read from the file
+# recorded at build time or, failing that, from the package metadata.
+write_constraints() {
+    if [ -f "${INDICO_CONSTRAINTS}" ]; then
+        cp "${INDICO_CONSTRAINTS}" "${CONSTRAINTS}"
+    else
+        python3 -c 'import importlib.metadata; print("indico==" + importlib.metadata.version("indico"))' \
+            > "${CONSTRAINTS}" || : > "${CONSTRAINTS}"
+    fi
+}
+
+# Installs the requested plugins from the wheelhouse, building their wheels first
+# when they are not cached yet.
+install_from_wheels() {
+    if [ -w "${WHEELHOUSE}" ]; then
+        WHEEL_DIR="${WHEELHOUSE}/${WHEEL_KEY}"
+    else
+        WHEEL_DIR="${PLUGIN_DIR}/.wheels"
+        rm -rf "${WHEEL_DIR}"
+    fi
+    if [ ! -f "${WHEEL_DIR}/.complete" ]; then
+        # Only the wheels of the requested plugin set are kept, anything not
+        # named after a key (e.g. the `lost+found` of the volume) being left alone.
+        find "${WHEELHOUSE}" -mindepth 1 -maxdepth 1 -regextype posix-extended \
+            -regex '.*/[0-9a-f]{64}(\.partial)?' ! -name "${WHEEL_KEY}" \
+            -exec rm -rf {} + 2>/dev/null || true
+        # Built aside and renamed once complete, so a failed build
+        # never leaves a partial wheelhouse behind.
+        rm -rf "${WHEEL_DIR}.partial"
+        # shellcheck disable=SC2086
+        timed wheels python3 -m pip wheel --no-cache-dir --no-deps \
+            -c "${CONSTRAINTS}" ${PIP_OPTS} \
+            --wheel-dir "${WHEEL_DIR}.partial" ${EXTRA_PLUGINS}
+        touch "${WHEEL_DIR}.partial/.complete"
+        rm -rf "${WHEEL_DIR}"
+        mv "${WHEEL_DIR}.partial" "${WHEEL_DIR}"
+    fi
+    timed install python3 -m pip install --no-index --no-cache-dir --user --upgrade \
+        --no-deps --break-system-packages "${WHEEL_DIR}"/*.whl
+}
+
+# Installs the requested plugins unless another process installed them while
+# waiting for the lock.
+install_plugins() {
+    (
+        flock -x 9
+        CURRENT_HASH=$(cat "${STATE_FILE}" 2>/dev/null || echo "")
+        if [ "${REQUESTED_HASH}" != "${CURRENT_HASH}" ]; then
+            PIP_OPTS=""
+            if [ -n "${PIP_INDEX_URL:-}" ]; then
+                PIP_OPTS="--index-url ${PIP_INDEX_URL}"
+            fi
+            # Pin the installed Indico version so plugins reuse it.
+            CONSTRAINTS="${PLUGIN_DIR}/.constraints.txt"
+            CONSTRAINTS_START=$(date +%s%3N)
+            write_constraints
+            report_phase plugin-install constraints "${CONSTRAINTS_START}"
+            WHEEL_KEY=$(printf '%s\n' "${PLUGINS_HASH}" | cat - "${CONSTRAINTS}" | sha256sum | cut -d' ' -f1)
+            if [ -z "${BUNDLE}" ]; then
+                install_from_wheels
+            else
+                # The leader builds the plugins and shares them; the other
+                # units wait for its bundle.
+                BUNDLE_WAIT="${PLUGIN_BUNDLE_WAIT:-600}"
+                if [ "${INDICO_PLUGIN_BUNDLE_BUILDER:-false}" = "true" ]; then
+                    BUNDLE_WAIT=0
+                fi
+                if ! timed bundle-download python3 "${PLUGIN_BUNDLE}" download \
+                    --wait "${BUNDLE_WAIT}" "${WHEEL_KEY}" "${PLUGIN_DIR}"; then
+                    install_from_wheels
+                    timed bundle-upload \
+                        python3 "${PLUGIN_BUNDLE}" upload "${WHEEL_KEY}" "${PLUGIN_DIR}" \
+                        || echo "Failed to upload the plugin bundle" >&2
+                fi
+            fi
+            echo "${REQUESTED_HASH}" > "${STATE_FILE}"
+        fi
+    ) 9>"${LOCK_FILE}"
+}
+
+MODE=""
+case "${1:-}" in
+    --install-plugins|--wait-plugins)
+        MODE="$1"
+        shift
+        ;;
+esac
+
 if [ -n "${FLASK_EXTERNAL_PLUGINS:-}" ]; then
     # indico-operator format is comma-separated; pip wants space-separated.
     EXTRA_PLUGINS=$(printf '%s' "${FLASK_EXTERNAL_PLUGINS}" | tr ',' ' ')
     PIP_INDEX_URL="${FLASK_PIP_INDEX_URL:-}"
-    # Only reinstall when the requested plugin set changes.
-    REQUESTED_HASH=$(printf '%s\n%s\n' "${EXTRA_PLUGINS}" "${PIP_INDEX_URL:-}" | sha256sum | cut -d' ' -f1)
-    INSTALLED_HASH=$(cat "${STATE_FILE}" 2>/dev/null || echo "")
-
-    if [ "${REQUESTED_HASH}" != "${INSTALLED_HASH}" ]; then
-        (
-            flock -x 9
-            CURRENT_HASH=$(cat "${STATE_FILE}" 2>/dev/null || echo "")
-            if [ "${REQUESTED_HASH}" != "${CURRENT_HASH}" ]; then
-                PIP_OPTS=""
-                if [ -n "${PIP_INDEX_URL:-}" ]; then
-                    PIP_OPTS="--index-url ${PIP_INDEX_URL}"
-                fi
-                # Pin the installed Indico version so plugins reuse it.
-                CONSTRAINTS="${PLUGIN_DIR}/.constraints.txt"
-                python3 -m pip freeze 2>/dev/null | grep '^indico==' > "${CONSTRAINTS}" || true
-                # shellcheck disable=SC2086
-                python3 -m pip install --no-cache-dir --user --upgrade \
-                    --no-deps --break-system-packages \
-                    -c "${CONSTRAINTS}" ${PIP_OPTS} ${EXTRA_PLUGINS}
-                echo "${REQUESTED_HASH}" > "${STATE_FILE}"
-            fi
-        ) 9>"${LOCK_FILE}"
+    PLUGINS_HASH=$(printf '%s\n%s\n%s\n' "${EXTRA_PLUGINS}" "${PIP_INDEX_URL:-}" \
+        "${INDICO_PLUGINS_GENERATION:-}" | sha256sum | cut -d' ' -f1)
+    # Only reinstall when the requested plugin set or the way it is shared changes.
+    BUNDLE=""
+    if [ "${FLASK_PLUGIN_BUNDLE:-false}" = "true" ] && [ -n "${S3_BUCKET:-}" ]; then
+        BUNDLE="${S3_BUCKET}"
+    fi
+    REQUESTED_HASH=$(printf '%s\n%s\n' "${PLUGINS_HASH}" "${BUNDLE}" | sha256sum | cut -d' ' -f1)
+
+    if [ "${MODE}" = "--wait-plugins" ]; then
+        WAITED=0
+        while [ "$(cat "${STATE_FILE}" 2>/dev/null || echo "")" != "${REQUESTED_HASH}" ] \
+            && [ "${WAITED}" -lt "${PLUGIN_INSTALL_WAIT:-900}" ]; do
+            sleep 1
+            WAITED=$((WAITED + 1))
+        done
+    fi
+    if [ "$(cat "${STATE_FILE}" 2>/dev/null || echo "")" != "${REQUESTED_HASH}" ]; then
+        INSTALL_START=$(date +%s%3N)
+        install_plugins
+        report_phase plugin-install total "${INSTALL_START}"
     fi
 fi
 
+if [ "${MODE}" = "--install-plugins" ]; then
+    # Pebble reports a service exiting within its first second as failing to
+    # start, even when it succeeded.
+    sleep 2
+    exit 0
+fi
+
+report_phase startup plugins "${STARTUP_STARTED_MS}"
+export INDICO_STARTUP_STARTED_MS="${STARTUP_STARTED_MS}"
+export INDICO_STARTUP_PLUGINS_MS=$(($(date +%s%3N) - STARTUP_STARTED_MS))
+case "$*" in
+    *gunicorn*)
+        # Named after the PID, kept by the Gunicorn master once exec'd
+        rm -f /srv/indico/tmp/startup-*
+        export INDICO_STARTUP_MARKER="/srv/indico/tmp/startup-$$"
+        : >"${INDICO_STARTUP_MARKER}"
+        ;;
+esac
+
 export PYTHONPATH="${PLUGIN_SITE}${PYTHONPATH:+:${PYTHONPATH}}"
 export INDICO_CONFIG="${INDICO_CONFIG:-/srv/indico/indico.conf}"
 
@@ -4,17 +4,170 @@
 
 """Flask Charm entrypoint."""
 
+import dataclasses
+import datetime
+import hashlib
+import json
 import logging
+import math
+import os
 import typing
 
 import ops
 import paas_charm.flask
+from paas_charm._gunicorn.webserver import GunicornWebserver, WebserverConfig
+from paas_charm._gunicorn.wsgi_app import WsgiApp
+from paas_charm.app import App
+from paas_charm.charm_state import CharmState
+from paas_charm.exceptions import CharmConfigInvalidError
+from paas_charm.redis import PaaSRedisRelationData, PaaSRedisRequires
 
 logger = logging.getLogger(__name__)
 
 EMAIL_LIST_SEPARATOR = ","
-EMAIL_LIST_MAX = 50
-INDICO_WRAPPER = "/srv/indico/start-indico.sh"
+# Runs the Indico CLI commands through the warm admin server of the workload,
+# falling back to a new process started by `start-indico.sh` with the environment
+# of the exec, when the server is down or has another environment. The command's
+# standard input is always sent (and closed) as the client reads it until EOF.
+INDICO_ADMIN_CLIENT = "/srv/indico/admin_client.py"
+# Digest of the workload environment, passed along with it so the admin server only
+# runs the commands of an exec sharing its environment, the others getting a new process
+ENVIRONMENT_DIGEST_ENV = "INDICO_ENVIRONMENT_DIGEST"
+# Per-email results of the bulk actions are written in the workload's log directory
+ACTION_RESULTS_DIR = "/srv/indico/log"
+# Wheels of the external plugins cached by `start-indico.sh`, on the plugin-wheels storage
+PLUGIN_WHEELHOUSE = "/srv/indico/wheelhouse"
+# Paths of the wheel dirs in the wheelhouse, named after their key (a SHA-256), as
+# pruned by `start-indico.sh`
+WHEEL_DIR_REGEX = r".*/[0-9a-f]{64}(\.partial)?"
+# Peer relation app data key of the generation of the external plugins shared with
+# plugin-bundle, bumped by refresh-external-resources so they are built again
+PLUGINS_GENERATION_KEY = "plugins-generation"
+# Gunicorn worker classes supported by the workload, gthread being sync with threads
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+# Threads per gthread worker when webserver-threads is not set
+GTHREAD_THREADS = 4
+# Memory used by an Indico worker, capping the default number of workers
+WORKER_MEMORY = 384 * 1024 * 1024
+# Limits of the workload container, as seen from its cgroup (v2)
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_MEMORY_MAX = "/sys/fs/cgroup/memory.max"
+# Sets the maxmemory policy of a Redis instance used by the workload
+REDIS_POLICY = "/srv/indico/redis_policy.py"
+# Roles of the Redis instances that can be related on their own
+REDIS_ROLES = ("cache", "broker")
+# How the files of the s3 relation are downloaded, see `_s3_proxy` in indico.conf
+S3_DOWNLOAD_MODES = ("proxy", "redirect", "auto")
+
+
+@dataclasses.dataclass
+class IndicoWebserverConfig(WebserverConfig):
+    """Gunicorn configuration, with the settings not supported by the flask-framework.
+
+    Attributes:
+        preload_app: whether to build the app in the master process before forking the workers.
+        max_requests: The number of requests after which a worker is restarted,
+            or None if not specified.
+        max_requests_jitter: The maximum random number of requests added to max_requests
+            per worker, or None if not specified.
+        graceful_timeout: The time given to the workers to finish their requests when
+            restarted, or None if not specified.
+    """
+
+    preload_app: bool = False
+    max_requests: int | None = None
+    max_requests_jitter: int | None = None
+    graceful_timeout: datetime.timedelta | None = None
+
+    def items(self) -> typing.Iterable[tuple[str, typing.Any]]:
+        """Return the dataclass values as an iterable of the key-value pairs.
+
+        Returns:
+            An iterable of the key-value pairs, the unset ones being None.
+        """
+        return {
+            **dict(super().items()),
+            "preload_app": self.preload_app or None,
+            "max_requests": self.max_requests,
+            "max_requests_jitter": self.max_requests_jitter,
+            "graceful_timeout": self.graceful_timeout,
+        }.items()
+
+
+class IndicoApp(WsgiApp):
+    """WSGI application manager, passing the Redis instances dedicated to a role.
+
+    The read-only endpoints of the postgresql relation are passed as well.
+    """
+
+    def __init__(
+        self,
+        *,
+        redis_roles: dict[str, PaaSRedisRelationData | None],
+        read_only_uris: list[str],
+        plugins_env: dict[str, str],
+        **kwargs: typing.Any,
+    ):
+        """Construct.
+
+        Args:
+            redis_roles: relation data of the Redis instance dedicated to each role, if any.
+            read_only_uris: URIs of the read-only replicas of the database.
+            plugins_env: environment variables of the install of the external plugins.
+            kwargs: passthrough to WsgiApp.
+        """
+        super().__init__(**kwargs)
+        self._redis_roles = redis_roles
+        self._read_only_uris = read_only_uris
+        self._plugins_env = plugins_env
+
+    def gen_environment(self) -> dict[str, str]:
+        """Generate the environment variables of the workload.
+
+        The Redis instance of a role is passed like the one of the redis
+        relation, e.g. as REDIS_CACHE_DB_CONNECT_STRING for the cache. The
+        database replicas are passed as POSTGRESQL_DB_READ_ONLY_URIS, a comma
+        separated list. The external plugins are installed with the generation
+        and builder of the plugin bundle. The digest of the environment is
+        added as INDICO_ENVIRONMENT_DIGEST.
+
+        Returns:
+            A dictionary representing the application environment variables.
+        """
+        env = super().gen_environment()
+        for role, relation_data in self._redis_roles.items():
+            env.update(
+                {
+                    f"REDIS_{role.upper()}_{name.removeprefix('REDIS_')}": value
+                    for name, value in self.generate_redis_env(relation_data).items()
+                }
+            )
+        if self._read_only_uris:
+            env["POSTGRESQL_DB_READ_ONLY_URIS"] = ",".join(self._read_only_uris)
+        env.update(self._plugins_env)
+        env[ENVIRONMENT_DIGEST_ENV] = hashlib.sha256(
+            json.dumps(env, sort_keys=True).encode()
+        ).hexdigest()
+        return env
+
+
+def default_workers(cpus: float | None, memory: int | None) -> int | None:
+    """Get the number of Gunicorn workers fitting the limits of the workload container.
+
+    Args:
+        cpus: number of CPUs available to the workload, None if not limited
+        memory: memory available to the workload in bytes, None if not limited
+
+    Returns:
+        int: two workers per CPU plus one, as many as fit in the memory, None
+            when neither is limited, the CPUs of the node not being the workload's
+    """
+    if cpus is None and memory is None:
+        return None
+    workers = 2 * math.ceil(cpus if cpus is not None else os.cpu_count() or 1) + 1
+    if memory is not None:
+        workers = min(workers, memory // WORKER_MEMORY)
+    return max(1, workers)
 
 
 class IndicoCharm(paas_charm.flask.Charm):
@@ -28,11 +181,263 @@ class IndicoCharm(paas_charm.flask.Charm):
         """
         super().__init__(*args)
         self.framework.observe(self.on["add-admin"].action, self._add_admin_action)
+        self.framework.observe(self.on["add-users"].action, self._add_users_action)
         self.framework.observe(self.on["anonymize-user"].action, self._anonymize_user_action)
+        self.framework.observe(
+            self.on["anonymize-user-status"].action, self._anonymize_user_status_action
+        )
         self.framework.observe(
             self.on["refresh-external-resources"].action,
             self._refresh_external_resources_action,
         )
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on["flask-app"].pebble_ready, self._prepare_wheelhouse)
+        self.framework.observe(self.on["plugin-wheels"].storage_attached, self._prepare_wheelhouse)
+        self._redis_requirers = {
+            role: PaaSRedisRequires(charm=self, relation_name=f"redis-{role}")
+            for role in REDIS_ROLES
+        }
+        self.framework.observe(self.on.config_changed, self._apply_redis_policies)
+        self.framework.observe(self.on.redis_relation_updated, self._apply_redis_policies)
+        self.framework.observe(self.on["flask-app"].pebble_ready, self._apply_redis_policies)
+        if "postgresql" in self._database_requirers:
+            self.framework.observe(
+                self._database_requirers["postgresql"].on.read_only_endpoints_changed,
+                self._on_read_only_endpoints_changed,
+            )
+
+    def _create_charm_state(self) -> CharmState:
+        """Create the charm state, validating the options only read by the workload.
+
+        Returns:
+            New CharmState
+
+        Raises:
+            CharmConfigInvalidError: if the S3 download mode is not supported.
+        """
+        s3_download_mode = self.config.get("s3-download-mode")
+        if s3_download_mode not in S3_DOWNLOAD_MODES:
+            raise CharmConfigInvalidError(
+                f"Invalid s3-download-mode {s3_download_mode!r}, only"
+                f" {', '.join(repr(mode) for mode in S3_DOWNLOAD_MODES)} are allowed."
+            )
+        return super()._create_charm_state()
+
+    def _create_app(self) -> App:
+        """Build the app, passing the Redis instances dedicated to a role.
+
+        Returns:
+            A new App instance.
+        """
+        charm_state = self._create_charm_state()
+        webserver = GunicornWebserver(
+            webserver_config=self.create_webserver_config(),
+            workload_config=self._workload_config,
+            container=self._container,
+        )
+        return IndicoApp(
+            container=self._container,
+            charm_state=charm_state,
+            workload_config=self._workload_config,
+            webserver=webserver,
+            database_migration=self._database_migration,
+            redis_roles={
+                role: requirer.to_relation_data()
+                for role, requirer in self._redis_requirers.items()
+            },
+            read_only_uris=self._read_only_uris(),
+            plugins_env=self._plugins_env(),
+        )
+
+    def _plugin_bundle_enabled(self) -> bool:
+        """Check that the external plugins are shared through the bucket of the s3 relation.
+
+        Returns:
+            True if plugin-bundle is set and the s3 relation exists.
+        """
+        return bool(self.config.get("plugin-bundle")) and self.model.get_relation("s3") is not None
+
+    def _plugins_env(self) -> dict[str, str]:
+        """Get the environment variables of the install of the external plugins.
+
+        The leader builds the plugin bundle, for the current generation of the
+        plugins, which is part of its key.
+
+        Returns:
+            INDICO_PLUGIN_BUNDLE_BUILDER, set on the leader, and
+            INDICO_PLUGINS_GENERATION, once bumped.
+        """
+        env = {}
+        if self.unit.is_leader():
+            env["INDICO_PLUGIN_BUNDLE_BUILDER"] = "true"
+        relation = self.model.get_relation("secret-storage")
+        if relation is not None and (
+            generation := relation.data[self.app].get(PLUGINS_GENERATION_KEY)
+        ):
+            env["INDICO_PLUGINS_GENERATION"] = generation
+        return env
+
+    def _on_leader_elected(self, _: ops.EventBase) -> None:
+        """Restart the workload, the new leader building the plugin bundle."""
+        self.restart()
+
+    def _read_only_uris(self) -> list[str]:
+        """Get the URIs of the read-only replicas of the postgresql relation.
+
+        Returns:
+            the URI of each read-only endpoint, empty if there is none.
+        """
+        requirer = self._database_requirers.get("postgresql")
+        if requirer is None:
+            return []
+        for data in requirer.fetch_relation_data(
+            fields=["read-only-endpoints", "username", "password", "database"]
+        ).values():
+            if not all(data.get(key) for key in ("read-only-endpoints", "username", "password")):
+                continue
+            database_name = data.get("database", requirer.database)
+            return [
+                f"postgresql://{data['username']}:{data['password']}@{endpoint}/{database_name}"
+                for endpoint in data["read-only-endpoints"].split(",")
+            ]
+        return []
+
+    def _on_read_only_endpoints_changed(self, _: ops.EventBase) -> None:
+        """Restart the workload with the new read-only endpoints of the database."""
+        self.restart()
+
+    def _redis_policies(self) -> dict[str, str]:
+        """Get the maxmemory policy of each Redis instance dedicated to a role.
+
+        The Redis of the broker gets the broker policy and the one of the cache
+        the cache policy. The Redis of the redis relation holds the results and
+        whatever has no dedicated instance, and may be shared with other
+        applications: its policy is left unchanged, like the one of an instance
+        used for several roles.
+
+        Returns:
+            the maxmemory policy by Redis URL.
+        """
+        shared = self._redis.to_relation_data() if self._redis else None
+        urls = {
+            role: str(relation_data.url)
+            for role, requirer in self._redis_requirers.items()
+            if (relation_data := requirer.to_relation_data()) is not None
+        }
+        if shared is not None:
+            urls = {role: url for role, url in urls.items() if url != str(shared.url)}
+        policies = {
+            "broker": typing.cast(str, self.config.get("redis-broker-maxmemory-policy")),
+            "cache": typing.cast(str, self.config.get("redis-cache-maxmemory-policy")),
+        }
+        return {
+            url: policies[role]
+            for role, url in urls.items()
+            if policies[role] and list(urls.values()).count(url) == 1
+        }
+
+    def _apply_redis_policies(self, _: ops.EventBase) -> None:
+        """Set the maxmemory policy of the Redis instances used by the workload.
+
+        Only done by the leader. A Redis refusing the policy, e.g. with the
+        CONFIG command disabled, keeps its own.
+        """
+        container = self._container
+        if not self.unit.is_leader() or not container.can_connect():
+            return
+        for url, policy in self._redis_policies().items():
+            try:
+                container.exec([REDIS_POLICY, url, policy]).wait_output()
+            except (ops.pebble.APIError, ops.pebble.ExecError) as exc:
+                logger.warning("Cannot set the maxmemory-policy of %s: %s", url, exc)
+
+    def create_webserver_config(self) -> WebserverConfig:
+        """Create the Gunicorn configuration from the charm config.
+
+        The gthread worker class is accepted on top of the ones of the
+        flask-framework. The app is only preloaded with the sync workers: the
+        gevent ones would monkey-patch the app after the master imported it. The
+        number of workers defaults to what fits the CPU and memory limits of the
+        workload container, if it has any.
+
+        Returns:
+            the Gunicorn configuration.
+
+        Raises:
+            CharmConfigInvalidError: if the worker class is not supported, or
+                cannot preload the app.
+        """
+        worker_class = self.config.get("webserver-worker-class")
+        if worker_class is not None and worker_class not in WORKER_CLASSES:
+            raise CharmConfigInvalidError(
+                f"Only {', '.join(repr(name) for name in WORKER_CLASSES)} worker classes"
+                " are allowed."
+            )
+        preload_app = bool(self.config.get("preload-app"))
+        if preload_app and worker_class not in (None, "sync"):
+            raise CharmConfigInvalidError(
+                "preload-app is only supported with the 'sync' worker class."
+            )
+        if worker_class == "gthread":
+            webserver_config = WebserverConfig.from_charm_config(dict(self.config))
+        else:
+            webserver_config = super().create_webserver_config()
+        if webserver_config.workers is None:
+            webserver_config.workers = default_workers(*self._workload_limits())
+        if webserver_config.threads is None and worker_class == "gthread":
+            webserver_config.threads = GTHREAD_THREADS
+        graceful_timeout = typing.cast(int, self.config.get("gunicorn-graceful-timeout"))
+        return IndicoWebserverConfig(
+            **dataclasses.asdict(webserver_config),
+            preload_app=preload_app,
+            max_requests=typing.cast(int, self.config.get("gunicorn-max-requests")) or None,
+            max_requests_jitter=(
+                typing.cast(int, self.config.get("gunicorn-max-requests-jitter")) or None
+            ),
+            graceful_timeout=(
+                datetime.timedelta(seconds=graceful_timeout) if graceful_timeout else None
+            ),
+        )
+
+    def _workload_limits(self) -> tuple[float | None, int | None]:
+        """Get the CPU and memory limits of the workload container.
+
+        Returns:
+            the number of CPUs and the memory in bytes, each None when not
+            limited or unknown.
+        """
+        cpus = None
+        memory = None
+        container = self._container
+        if not container.can_connect():
+            return cpus, memory
+        try:
+            quota, period = container.pull(CGROUP_CPU_MAX).read().split()
+            memory_max = container.pull(CGROUP_MEMORY_MAX).read().strip()
+        except (ops.pebble.PathError, ValueError):
+            logger.warning("Cannot read the cgroup limits of the workload container")
+            return cpus, memory
+        if quota != "max":
+            cpus = int(quota) / int(period)
+        if memory_max != "max":
+            memory = int(memory_max)
+        return cpus, memory
+
+    def _prepare_wheelhouse(self, _: ops.EventBase) -> None:
+        """Let the workload user write the plugin wheels to the attached storage.
+
+        The storage is mounted owned by root, while `start-indico.sh` runs as the
+        workload user. Until it is writable, the plugin wheels are not cached.
+        Without the storage, which is optional, e.g. for the deployments
+        predating it, the wheels are kept in the workload container.
+        """
+        container = self._container
+        if not self.model.storages["plugin-wheels"] or not container.can_connect():
+            return
+        try:
+            container.exec(["chown", "_daemon_:_daemon_", PLUGIN_WHEELHOUSE]).wait()
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.warning("Cannot give the plugin-wheels storage to the workload user: %s", exc)
 
     def _add_admin_action(self, event: ops.ActionEvent) -> None:
         """Add a new admin user to Indico.
@@ -45,12 +450,20 @@ class IndicoCharm(paas_charm.flask.Charm):
             event.fail("Cannot connect to the Indico workload container")
             return
         email = event.params["email"]
-        cmd = [INDICO_WRAPPER, "indico", "autocreate", "admin", email, event.params["password"]]
+        cmd = [
+            INDICO_ADMIN_CLIENT,
+            "indico",
+            "autocreate",
+            "admin",
+            email,
+            event.params["password"],
+        ]
         process = container.exec(
             cmd,
             user="_daemon_",
             working_dir="/flask/app",
             environment=self._gen_environment(),
+            stdin="",
         )
         try:
             output = process.wait_output()
@@ -59,31 +472,150 @@ class IndicoCharm(paas_charm.flask.Charm):
             logger.exception("Action add-admin failed: %s", ex.stdout)
             event.fail(f"Failed to create admin {email}: {ex.stdout!r}")
 
-    def _execute_anonymize_cmd(self, event: ops.ActionEvent) -> typing.Iterator[str]:
-        """Execute the anonymize command for each email.
+    @staticmethod
+    def _iter_json_messages(
+        process: ops.pebble.ExecProcess, action: str
+    ) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        """Read the JSON objects printed by a workload command as soon as they are printed.
 
         Args:
-            event: Event triggered by the anonymize-user action.
+            process: The running workload command.
+            action: Name of the action running the command.
 
         Yields:
-            Output of each command execution.
+            The next JSON object printed by the command.
         """
-        container = self._container
-        for email in event.params["email"].split(EMAIL_LIST_SEPARATOR):
-            cmd = [INDICO_WRAPPER, "indico", "anonymize", "user", email]
-            process = container.exec(
-                cmd,
-                user="_daemon_",
-                working_dir="/flask/app",
-                environment=self._gen_environment(),
-            )
+        for line in typing.cast(typing.TextIO, process.stdout):
+            # Anything else than the JSON progress (e.g. plugin install logs) is only logged
             try:
-                out = process.wait_output()
-                yield out[0].replace("\n", "")
-            except ops.pebble.ExecError as ex:
-                logger.exception("Action anonymize-user failed: %s", ex.stdout)
-                event.fail("Failed to anonymize one or more users, please verify the results.")
-                yield f"Failed to anonymize user {email}: {ex.stdout!r}"
+                message = json.loads(line)
+            except ValueError:
+                logger.debug("%s: %s", action, line.rstrip())
+                continue
+            if isinstance(message, dict):
+                yield message
+
+    def _execute_anonymize_cmd(
+        self, event: ops.ActionEvent, results_file: str
+    ) -> typing.Dict[str, int]:
+        """Execute the anonymize command for all the emails in a single workload process.
+
+        The emails are processed in chunks, each chunk progress being logged in the
+        action as soon as it is committed. With the dry-run parameter, only the rows
+        that would be written are counted.
+
+        Args:
+            event: Event triggered by the anonymize-user action.
+            results_file: Path of the file where the per-email results are written.
+
+        Returns:
+            The summary of the anonymization (number of emails per status).
+        """
+        cmd = [
+            INDICO_ADMIN_CLIENT,
+            "indico",
+            "anonymize",
+            "users",
+            "--chunk-size",
+            str(event.params["chunk-size"]),
+            "--output",
+            results_file,
+        ]
+        if event.params.get("dry-run"):
+            cmd.append("--dry-run")
+        stdin = ""
+        if event.params.get("email-file"):
+            cmd.extend(["--input", event.params["email-file"]])
+        else:
+            stdin = "\n".join(event.params.get("email", "").split(EMAIL_LIST_SEPARATOR))
+        process = self._container.exec(
+            cmd,
+            user="_daemon_",
+            working_dir="/flask/app",
+            environment=self._gen_environment(),
+            stdin=stdin,
+            combine_stderr=True,
+        )
+        summary: typing.Dict[str, int] = {}
+        for message in self._iter_json_messages(process, "anonymize-user"):
+            if "progress" in message and "estimated-rows" in message["progress"]:
+                summary = message["progress"]
+                event.log(
+                    f"Counted {summary['processed']} emails: "
+                    f"{summary.get('found', 0)} found, "
+                    f"{summary.get('not-found', 0)} not found, "
+                    f"{summary['estimated-rows']} rows to anonymize"
+                )
+            elif "progress" in message:
+                summary = message["progress"]
+                event.log(
+                    f"Processed {summary['processed']} emails: "
+                    f"{summary.get('anonymized', 0)} anonymized, "
+                    f"{summary.get('not-found', 0)} not found, "
+                    f"{summary.get('error', 0)} failed"
+                )
+            if "field-type-cache" in message:
+                logger.info("anonymize-user field type cache: %s", message["field-type-cache"])
+            summary = message.get("summary", summary)
+        try:
+            process.wait()
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action anonymize-user failed with exit code %s", ex.exit_code)
+            # The command may have stopped before reporting any failed email
+            summary["error"] = summary.get("error") or 1
+        return summary
+
+    def _execute_anonymize_job_cmd(
+        self, args: typing.List[str], stdin: str = ""
+    ) -> typing.Dict[str, typing.Any]:
+        """Execute an anonymize command managing a background job and parse its JSON output.
+
+        Args:
+            args: Arguments of the `indico anonymize` command.
+            stdin: Data sent to the command's standard input.
+
+        Returns:
+            The last JSON object printed by the command.
+
+        Raises:
+            ExecError: if the command fails.
+        """
+        process = self._container.exec(
+            [INDICO_ADMIN_CLIENT, "indico", "anonymize", *args],
+            user="_daemon_",
+            working_dir="/flask/app",
+            environment=self._gen_environment(),
+            stdin=stdin,
+        )
+        output, _ = process.wait_output()
+        message: typing.Dict[str, typing.Any] = {}
+        # Anything else than the JSON output (e.g. plugin install logs) is ignored
+        for line in output.splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.debug("anonymize: %s", line.rstrip())
+        return message
+
+    def _enqueue_anonymize_job(self, event: ops.ActionEvent) -> None:
+        """Queue the anonymization of the users on the Celery worker.
+
+        Args:
+            event: Event triggered by the anonymize-user action.
+        """
+        args = ["enqueue", "--chunk-size", str(event.params["chunk-size"])]
+        stdin = ""
+        if event.params.get("email-file"):
+            args.extend(["--input", event.params["email-file"]])
+        else:
+            stdin = "\n".join(event.params.get("email", "").split(EMAIL_LIST_SEPARATOR))
+        try:
+            job = self._execute_anonymize_job_cmd(args, stdin)
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action anonymize-user failed: %s", ex.stdout)
+            event.fail(f"Failed to queue the anonymization: {ex.stdout!r}")
+            return
+        event.set_results({"job-id": job["job-id"], "emails": job["emails"]})
 
     def _anonymize_user_action(self, event: ops.ActionEvent) -> None:
         """Anonymize one or more Indico users.
@@ -95,23 +627,150 @@ class IndicoCharm(paas_charm.flask.Charm):
         if not container.can_connect():
             event.fail("Cannot connect to the Indico workload container")
             return
-        emails = event.params["email"].split(EMAIL_LIST_SEPARATOR)
-        if len(emails) > EMAIL_LIST_MAX:
-            event.fail(f"Failed to anonymize user: more than {EMAIL_LIST_MAX} emails not allowed")
+        if not event.params.get("email") and not event.params.get("email-file"):
+            event.fail("Failed to anonymize user: either email or email-file must be set")
+            return
+        if event.params.get("background"):
+            if event.params.get("dry-run"):
+                event.fail("Failed to anonymize user: dry-run cannot run in the background")
+                return
+            self._enqueue_anonymize_job(event)
             return
-        output_list = list(self._execute_anonymize_cmd(event))
+        results_file = f"{ACTION_RESULTS_DIR}/anonymize-{event.id}.jsonl"
+        summary = self._execute_anonymize_cmd(event, results_file)
+        results = {
+            "results-file": results_file,
+            "processed": summary.get("processed", 0),
+            "anonymized": summary.get("anonymized", 0),
+            "not-found": summary.get("not-found", 0),
+            "failed": summary.get("error", 0),
+        }
+        if event.params.get("dry-run"):
+            results["found"] = summary.get("found", 0)
+            results["estimated-rows"] = summary.get("estimated-rows", 0)
+        event.set_results(results)
+        if summary.get("error"):
+            event.fail(
+                f"Failed to anonymize one or more users, please verify the results in "
+                f"{results_file}."
+            )
+
+    def _add_users_action(self, event: ops.ActionEvent) -> None:
+        """Create many Indico users from a file in the workload container.
+
+        Args:
+            event: Event triggered by the add-users action.
+        """
+        container = self._container
+        if not container.can_connect():
+            event.fail("Cannot connect to the Indico workload container")
+            return
+        results_file = f"{ACTION_RESULTS_DIR}/add-users-{event.id}.jsonl"
+        cmd = [
+            INDICO_ADMIN_CLIENT,
+            "indico",
+            "autocreate",
+            "users",
+            "--input",
+            event.params["users-file"],
+            "--format",
+            event.params["format"],
+            "--chunk-size",
+            str(event.params["chunk-size"]),
+            "--hash-workers",
+            str(event.params["hash-workers"]),
+            "--output",
+            results_file,
+        ]
+        process = container.exec(
+            cmd,
+            user="_daemon_",
+            working_dir="/flask/app",
+            environment=self._gen_environment(),
+            stdin="",
+            combine_stderr=True,
+        )
+        summary: typing.Dict[str, int] = {}
+        for message in self._iter_json_messages(process, "add-users"):
+            if "progress" in message:
+                summary = message["progress"]
+                event.log(
+                    f"Processed {summary['processed']} users: "
+                    f"{summary.get('created', 0)} created, "
+                    f"{summary.get('skipped', 0)} skipped, "
+                    f"{summary.get('error', 0)} failed"
+                )
+            summary = message.get("summary", summary)
+        try:
+            process.wait()
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action add-users failed with exit code %s", ex.exit_code)
+            # The command may have stopped before reporting any failed user
+            summary["error"] = summary.get("error") or 1
         event.set_results(
             {
-                "user": event.params["email"],
-                "output": EMAIL_LIST_SEPARATOR.join(output_list),
+                "results-file": results_file,
+                "processed": summary.get("processed", 0),
+                "created": summary.get("created", 0),
+                "skipped": summary.get("skipped", 0),
+                "failed": summary.get("error", 0),
             }
         )
+        if summary.get("error"):
+            event.fail(
+                f"Failed to create one or more users, please verify the results in {results_file}."
+            )
+
+    def _anonymize_user_status_action(self, event: ops.ActionEvent) -> None:
+        """Report the state of a background anonymization job.
+
+        Args:
+            event: Event triggered by the anonymize-user-status action.
+        """
+        container = self._container
+        if not container.can_connect():
+            event.fail("Cannot connect to the Indico workload container")
+            return
+        job_id = event.params["job-id"]
+        results_file = f"{ACTION_RESULTS_DIR}/anonymize-{job_id}.jsonl"
+        try:
+            status = self._execute_anonymize_job_cmd(["status", job_id, "--output", results_file])
+        except ops.pebble.ExecError as ex:
+            logger.exception("Action anonymize-user-status failed: %s", ex.stdout)
+            event.fail(f"Failed to get the status of job {job_id}: {ex.stdout!r}")
+            return
+        results: typing.Dict[str, typing.Any] = {"job-id": job_id, "state": status["state"]}
+        summary = status.get("summary") or status.get("progress") or {}
+        if summary:
+            results.update(
+                {
+                    "processed": summary.get("processed", 0),
+                    "anonymized": summary.get("anonymized", 0),
+                    "not-found": summary.get("not-found", 0),
+                    "failed": summary.get("error", 0),
+                }
+            )
+        if "total" in summary:
+            results["total"] = summary["total"]
+        if "summary" in status:
+            results["results-file"] = results_file
+        event.set_results(results)
+        if "error" in status:
+            event.fail(f"Anonymization job {job_id} failed: {status['error']}")
+        elif summary.get("error") and "summary" in status:
+            event.fail(
+                f"Failed to anonymize one or more users, please verify the results in "
+                f"{results_file}."
+            )
 
     def _refresh_external_resources_action(self, event: ops.ActionEvent) -> None:
         """Reinstall/upgrade the external plugins by restarting the workload.
 
-        Clears the plugin install marker so `start-indico.sh` reinstalls
-        `external_plugins` on the next service start, then restarts services.
+        Clears the plugin install marker and the cached plugin wheels so
+        `start-indico.sh` downloads and reinstalls `external_plugins` on the next
+        service start, then restarts services. With plugin-bundle, the leader
+        bumps the generation of the plugins instead, so every unit restarts with
+        a new bundle key, which the leader builds again.
 
         Args:
             event: Event triggered by the refresh-external-resources action.
@@ -120,7 +779,37 @@ class IndicoCharm(paas_charm.flask.Charm):
         if not container.can_connect():
             event.fail("Cannot connect to the Indico workload container")
             return
+        if self._plugin_bundle_enabled():
+            relation = self.model.get_relation("secret-storage")
+            if not self.unit.is_leader() or relation is None:
+                event.fail("Only the leader unit can refresh the plugins shared by plugin-bundle")
+                return
+            data = relation.data[self.app]
+            data[PLUGINS_GENERATION_KEY] = str(int(data.get(PLUGINS_GENERATION_KEY, "0")) + 1)
+            self.restart()
+            event.set_results({"result": "external plugins refresh triggered on all units"})
+            return
         container.exec(["rm", "-f", "/srv/indico/plugins/.installed"]).wait()
+        # Only the wheel dirs, named after their key, not the lost+found of the storage
+        container.exec(
+            [
+                "find",
+                PLUGIN_WHEELHOUSE,
+                "-mindepth",
+                "1",
+                "-maxdepth",
+                "1",
+                "-regextype",
+                "posix-extended",
+                "-regex",
+                WHEEL_DIR_REGEX,
+                "-exec",
+                "rm",
+                "-rf",
+                "{}",
+                "+",
+            ]
+        ).wait()
         self.restart()
         event.set_results({"result": "external plugins refresh triggered"})
 
@@ -0,0 +1,258 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the admin server running the commands of the charm actions."""
+
+import json
+import socket
+import sys
+import threading
+
+import admin_client
+import admin_server
+import click
+import pytest
+
+DIGEST = "0123abcd"
+
+
+@click.group()
+def cli():
+    """Fake Indico CLI."""
+
+
+@cli.command()
+@click.argument("name")
+def autocreate(name):
+    """Echo a name and the standard input.
+
+    Args:
+        name: the name
+    """
+    click.echo(f"created {name}")
+    click.echo(sys.stdin.read(), err=True, nl=False)
+
+
+@cli.command()
+def shell():
+    """Fail the test, not being allowed."""
+    pytest.fail("The shell command was run")
+
+
+def _request(request, stdin=""):
+    """Send a request to the server and read the response.
+
+    Args:
+        request: the request
+        stdin: standard input of the command
+
+    Returns:
+        the exit code returned by the server and the messages of the response
+    """
+    server, client = socket.socketpair()
+    results = []
+
+    def handle():
+        with server:
+            results.append(admin_server.handle_connection(server, cli, None))
+
+    thread = threading.Thread(target=handle)
+    thread.start()
+    with client, client.makefile("r", encoding="utf-8") as rfile:
+        client.sendall((request + "\n" + stdin).encode())
+        client.shutdown(socket.SHUT_WR)
+        messages = [json.loads(line) for line in rfile]
+        thread.join()
+    return results[0], messages
+
+
+@pytest.fixture(name="environment_digest")
+def environment_digest_fixture(monkeypatch):
+    """Set the environment digest of the server."""
+    monkeypatch.setattr(admin_server, "ENVIRONMENT_DIGEST", DIGEST)
+
+
+@pytest.mark.usefixtures("environment_digest")
+def test_handle_connection():
+    """arrange: A request for an allowed command.
+    act: Handle the connection.
+    assert: The command is run, its output and exit code streamed to the client.
+    """
+    request = json.dumps({"args": ["autocreate", "admin"], "environment-digest": DIGEST})
+
+    exit_code, messages = _request(request, stdin="password")
+
+    assert exit_code == 0
+    assert messages == [
+        {"accepted": True},
+        {"stdout": "created admin\n"},
+        {"stderr": "password"},
+        {"exit-code": 0},
+    ]
+
+
+@pytest.mark.usefixtures("environment_digest")
+@pytest.mark.parametrize(
+    "args",
+    [
+        pytest.param(["shell"], id="other command"),
+        pytest.param([], id="no command"),
+        pytest.param(None, id="no args"),
+    ],
+)
+def test_handle_connection_not_allowed(args):
+    """arrange: A request for a command not used by the charm actions.
+    act: Handle the connection.
+    assert: The command is rejected with an exit code of 2.
+    """
+    request = json.dumps({"args": args, "environment-digest": DIGEST})
+
+    exit_code, messages = _request(request)
+
+    assert exit_code == 2
+    assert messages == [
+        {"accepted": True},
+        {"stderr": "Command not allowed, expected one of: anonymize, autocreate\n"},
+        {"exit-code": 2},
+    ]
+
+
+@pytest.mark.usefixtures("environment_digest")
+@pytest.mark.parametrize(
+    "request_line",
+    [
+        pytest.param(json.dumps({"args": ["autocreate", "admin"]}), id="no digest"),
+        pytest.param(
+            json.dumps({"args": ["autocreate", "admin"], "environment-digest": "other"}),
+            id="other digest",
+        ),
+    ],
+)
+def test_handle_connection_stale_environment(request_line):
+    """arrange: A request from a client having another environment than the server.
+    act: Handle the connection.
+    assert: The command is left to the client.
+    """
+    exit_code, messages = _request(request_line)
+
+    assert exit_code is None
+    assert messages == [{"stale": True}]
+
+
+def test_handle_connection_invalid_request():
+    """arrange: A request which is not JSON.
+    act: Handle the connection.
+    assert: The request is rejected with a ValueError.
+    """
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall(b"autocreate admin\n")
+        with pytest.raises(ValueError):
+            admin_server.handle_connection(server, cli, None)
+
+
+class ExecCalledError(Exception):
+    """Raised instead of replacing the process of the client."""
+
+
+@pytest.fixture(name="execv")
+def execv_fixture(monkeypatch):
+    """Record the command run in place of the client.
+
+    Returns:
+        the arguments of os.execv
+    """
+    calls = []
+
+    def execv(path, args):
+        calls.append([path, *args])
+        raise ExecCalledError()
+
+    monkeypatch.setattr(admin_client.os, "execv", execv)
+    return calls
+
+
+def test_client_fallback(monkeypatch, tmp_path, execv):
+    """arrange: No admin server listening.
+    act: Run a command with the client.
+    assert: The command is run in a new process by the wrapper.
+    """
+    monkeypatch.setattr(admin_client, "ADMIN_SOCKET", str(tmp_path / "admin.sock"))
+
+    with pytest.raises(ExecCalledError):
+        admin_client.main(["indico", "autocreate", "admin"])
+
+    wrapper = admin_client.INDICO_WRAPPER
+    assert execv == [[wrapper, wrapper, "indico", "autocreate", "admin"]]
+
+
+def _serve(path, responses):
+    """Answer a single request of the client like the admin server would.
+
+    Args:
+        path: path of the Unix socket
+        responses: the messages of the response
+
+    Returns:
+        the thread serving the request and the list getting the request
+    """
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen()
+    requests = []
+
+    def serve():
+        with listener:
+            conn, _ = listener.accept()
+            with conn, conn.makefile("rw", encoding="utf-8") as file:
+                requests.append(json.loads(file.readline()))
+                for response in responses:
+                    file.write(json.dumps(response) + "\n")
+                file.flush()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    return thread, requests
+
+
+def test_client_stale_environment(monkeypatch, tmp_path, execv):
+    """arrange: An admin server having another environment than the client.
+    act: Run a command with the client.
+    assert: The command is run in a new process by the wrapper.
+    """
+    path = str(tmp_path / "admin.sock")
+    monkeypatch.setattr(admin_client, "ADMIN_SOCKET", path)
+    monkeypatch.setenv(admin_client.ENVIRONMENT_DIGEST_ENV, DIGEST)
+    thread, requests = _serve(path, [{"stale": True}])
+
+    with pytest.raises(ExecCalledError):
+        admin_client.main(["indico", "autocreate", "admin"])
+    thread.join()
+
+    assert requests == [{"args": ["autocreate", "admin"], "environment-digest": DIGEST}]
+    wrapper = admin_client.INDICO_WRAPPER
+    assert execv == [[wrapper, wrapper, "indico", "autocreate", "admin"]]
+
+
+def test_client(monkeypatch, tmp_path, capsys, execv):
+    """arrange: An admin server having the environment of the client.
+    act: Run a command with the client.
+    assert: The output and exit code of the command run by the server are relayed.
+    """
+    path = str(tmp_path / "admin.sock")
+    monkeypatch.setattr(admin_client, "ADMIN_SOCKET", path)
+    monkeypatch.setattr(admin_client.sys, "stdin", open("/dev/null", encoding="utf-8"))
+    responses = [
+        {"accepted": True},
+        {"stdout": "created"},
+        {"stderr": "warning"},
+        {"exit-code": 3},
+    ]
+    thread, _ = _serve(path, responses)
+
+    exit_code = admin_client.main(["indico", "autocreate", "admin"])
+    thread.join()
+
+    assert exit_code == 3
+    assert capsys.readouterr() == ("created", "warning")
+    assert not execv
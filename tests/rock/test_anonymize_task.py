@@ -0,0 +1,39 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the retention sweep of the anonymize plugin."""
+
+import types
+from unittest.mock import MagicMock
+
+import redis
+from anonymize import task
+from anonymize.retention import RetentionSettings
+
+
+def test_sweep_lock_lost(monkeypatch):
+    """arrange: A sweep whose lock expires during its first batch.
+    act: Run the sweep.
+    assert: The sweep stops before the second batch and still sends its metrics.
+    """
+    users = iter([[types.SimpleNamespace(id=1, email="a@example.com")]] * 2)
+    monkeypatch.setattr(task, "inactive_users", lambda *_: next(users))
+    monkeypatch.setattr(
+        task,
+        "anonymize_chunk",
+        lambda emails, *_: [
+            {"email": email, "status": "anonymized", "rows": 3} for email in emails
+        ],
+    )
+    send_metrics = MagicMock()
+    monkeypatch.setattr(task, "send_metrics", send_metrics)
+    lock = MagicMock()
+    lock.reacquire.side_effect = [True, redis.exceptions.LockNotOwnedError("expired")]
+
+    task._sweep(RetentionSettings(days=30), lock)
+
+    assert lock.reacquire.call_count == 2
+    [metrics] = send_metrics.call_args.args
+    assert "indico_anonymize_retention_users:1|c|#status:anonymized" in metrics
+    assert "indico_anonymize_retention_rows:3|c" in metrics
+    assert "indico_anonymize_retention_batches:1|c" in metrics
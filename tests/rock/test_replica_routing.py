@@ -0,0 +1,262 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the routing of the queries to the read replicas."""
+
+import time
+
+import pytest
+from flask import Flask, session
+from replica.routing import (
+    PINNED_KEY,
+    PRIMARY_UNTIL_KEY,
+    REPLICA_CONNECT_TIMEOUT,
+    ReplicaRouter,
+    ReplicaRoutingMixin,
+)
+from sqlalchemy import column, delete, select, table
+from sqlalchemy.exc import OperationalError
+
+EVENTS = table("events", column("id"))
+PRIMARY = object()
+
+
+class FakeReplica:
+    """Replica with a fake engine."""
+
+    def __init__(self, healthy=True):
+        """Construct.
+
+        Args:
+            healthy: whether the replica can serve reads
+        """
+        self.engine = object()
+        self.healthy = healthy
+
+    def is_healthy(self, max_lag):
+        """Check that the replica can serve reads.
+
+        Args:
+            max_lag: maximum replication lag, in seconds
+
+        Returns:
+            bool: True if the replica can serve reads
+        """
+        return self.healthy
+
+
+class FakeSession:
+    """SQLAlchemy session bound to the primary."""
+
+    def __init__(self):
+        """Construct."""
+        self.info = {}
+        self._flushing = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **_):
+        """Select the engine of a query.
+
+        Args:
+            mapper: the mapper of the query
+            clause: the statement of the query
+            bind: the engine or connection explicitly requested
+            _: passthrough to the session
+
+        Returns:
+            the explicitly requested engine, or the primary
+        """
+        return bind or PRIMARY
+
+
+def _session(replica):
+    """Create a routing session.
+
+    Args:
+        replica: the read replica
+
+    Returns:
+        the session, with its router sending the reads of `event.display` to the replica
+    """
+    router = ReplicaRouter([replica], ["event.display"], max_lag=10)
+    session_class = type("RoutingSession", (ReplicaRoutingMixin, FakeSession), {"router": router})
+    return session_class()
+
+
+@pytest.fixture(name="app")
+def app_fixture():
+    """Flask app with the endpoints of an event."""
+    app = Flask(__name__)
+    app.secret_key = "secret"
+    app.add_url_rule("/event/<int:event_id>/", "event.display", methods=["GET", "POST"])
+    app.add_url_rule("/event/<int:event_id>/manage/", "event.manage")
+    return app
+
+
+@pytest.mark.parametrize(
+    "path, method, statement, expected",
+    [
+        pytest.param("/event/1/", "GET", select(EVENTS), "replica", id="select"),
+        pytest.param("/event/1/", "HEAD", select(EVENTS), "replica", id="head"),
+        pytest.param("/event/1/", "GET", None, "primary", id="no statement"),
+        pytest.param("/event/1/", "POST", select(EVENTS), "primary", id="post"),
+        pytest.param("/event/1/manage/", "GET", select(EVENTS), "primary", id="other endpoint"),
+        pytest.param(
+            "/event/1/", "GET", select(EVENTS).with_for_update(), "primary", id="for update"
+        ),
+    ],
+)
+def test_get_bind(app, path, method, statement, expected):
+    """arrange: A session in a request.
+    act: Select the engine of a query.
+    assert: Only the plain SELECT of the safe requests to the allowed endpoints
+        go to the replica.
+    """
+    replica = FakeReplica()
+    db_session = _session(replica)
+
+    with app.test_request_context(path, method=method):
+        engine = db_session.get_bind(clause=statement)
+
+    assert engine is (replica.engine if expected == "replica" else PRIMARY)
+
+
+def test_get_bind_outside_request(app):
+    """arrange: A session outside of any request, e.g. in a Celery task.
+    act: Select the engine of a SELECT.
+    assert: The primary is used.
+    """
+    db_session = _session(FakeReplica())
+
+    with app.app_context():
+        assert db_session.get_bind(clause=select(EVENTS)) is PRIMARY
+
+
+def test_get_bind_explicit_bind(app):
+    """arrange: A session in a request to an allowed endpoint.
+    act: Select the engine of a SELECT bound to an engine.
+    assert: The requested engine is used.
+    """
+    db_session = _session(FakeReplica())
+    bind = object()
+
+    with app.test_request_context("/event/1/"):
+        assert db_session.get_bind(clause=select(EVENTS), bind=bind) is bind
+
+
+def test_get_bind_unhealthy_replica(app):
+    """arrange: A session in a request to an allowed endpoint, the replica lagging.
+    act: Select the engine of a SELECT.
+    assert: The primary is used.
+    """
+    db_session = _session(FakeReplica(healthy=False))
+
+    with app.test_request_context("/event/1/"):
+        assert db_session.get_bind(clause=select(EVENTS)) is PRIMARY
+
+
+def test_get_bind_after_write(app):
+    """arrange: A session in a GET request to an allowed endpoint.
+    act: Run a DELETE, then a SELECT.
+    assert: Both go to the primary, the user's next requests still reading from replicas.
+    """
+    db_session = _session(FakeReplica())
+
+    with app.test_request_context("/event/1/"):
+        assert db_session.get_bind(clause=delete(EVENTS)) is PRIMARY
+        assert db_session.get_bind(clause=select(EVENTS)) is PRIMARY
+        assert db_session.info[PINNED_KEY]
+        assert PRIMARY_UNTIL_KEY not in session
+
+
+def test_get_bind_after_unsafe_request(app):
+    """arrange: A session in a POST request to an allowed endpoint.
+    act: Run a DELETE, then a SELECT in the user's next GET request.
+    assert: Both go to the primary, as long as the maximum replication lag.
+    """
+    replica = FakeReplica()
+
+    with app.test_request_context("/event/1/", method="POST"):
+        assert _session(replica).get_bind(clause=delete(EVENTS)) is PRIMARY
+        assert session[PRIMARY_UNTIL_KEY] > time.time() + 9
+        primary_until = session[PRIMARY_UNTIL_KEY]
+
+    with app.test_request_context("/event/1/"):
+        session[PRIMARY_UNTIL_KEY] = primary_until
+        assert _session(replica).get_bind(clause=select(EVENTS)) is PRIMARY
+
+
+def test_get_bind_flush_in_safe_request(app):
+    """arrange: A session in a GET request to an allowed endpoint.
+    act: Flush the session.
+    assert: The session and the user read from the primary afterwards.
+    """
+    db_session = _session(FakeReplica())
+
+    with app.test_request_context("/event/1/"):
+        db_session._flushing = True
+        assert db_session.get_bind() is PRIMARY
+        db_session._flushing = False
+        assert db_session.get_bind(clause=select(EVENTS)) is PRIMARY
+        assert PRIMARY_UNTIL_KEY in session
+
+
+def test_get_bind_user_pinned_expired(app):
+    """arrange: A user who wrote longer ago than the maximum replication lag.
+    act: Select the engine of a SELECT.
+    assert: The replica is used again.
+    """
+    replica = FakeReplica()
+
+    with app.test_request_context("/event/1/"):
+        session[PRIMARY_UNTIL_KEY] = time.time() - 1
+        assert _session(replica).get_bind(clause=select(EVENTS)) is replica.engine
+
+
+def test_from_uris():
+    """arrange: The URIs of the primary and of a replica.
+    act: Create the router.
+    assert: The replica takes the query and options of the primary, with timeouts.
+    """
+    router = ReplicaRouter.from_uris(
+        ["postgresql://replica:5432/indico"],
+        primary_uri="postgresql://primary:5432/indico?plugin=dbpool&pool_pre_ping=true",
+        engine_options={"pool_size": 5, "connect_args": {"options": "-c work_mem=8MB"}},
+        endpoints=["event.display"],
+        max_lag=10,
+    )
+
+    (replica,) = router.replicas
+    assert replica.uri == "postgresql://replica:5432/indico?plugin=dbpool&pool_pre_ping=true"
+    assert replica._engine_options == {
+        "pool_size": 5,
+        "connect_args": {
+            "connect_timeout": REPLICA_CONNECT_TIMEOUT,
+            "options": "-c work_mem=8MB -c statement_timeout=30000",
+        },
+    }
+
+
+def test_replica_unreachable(monkeypatch):
+    """arrange: A replica failing to connect.
+    act: Check its health twice.
+    assert: It is unhealthy, and only checked once within the check interval.
+    """
+    router = ReplicaRouter.from_uris(
+        ["postgresql://replica:5432/indico"],
+        primary_uri="postgresql://primary:5432/indico",
+        engine_options={},
+        endpoints=[],
+        max_lag=10,
+    )
+    (replica,) = router.replicas
+    attempts = []
+
+    def connect():
+        attempts.append(True)
+        raise OperationalError("SELECT 1", {}, Exception("timeout expired"))
+
+    monkeypatch.setattr(replica, "_engine", type("Engine", (), {"connect": staticmethod(connect)}))
+
+    assert not replica.is_healthy(10)
+    assert not replica.is_healthy(10)
+    assert len(attempts) == 1
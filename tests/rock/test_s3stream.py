@@ -0,0 +1,220 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the streamed S3 downloads of the s3stream plugin."""
+
+import datetime
+import io
+
+import pytest
+from flask import Flask
+from s3stream.storage import send_object
+from werkzeug.exceptions import PreconditionFailed, RequestedRangeNotSatisfiable
+
+DATA = bytes(range(100))
+ETAG = '"0123abcd"'
+LAST_MODIFIED = datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+
+
+class FakeBody(io.BytesIO):
+    """Streaming body of an S3 object."""
+
+    def iter_chunks(self, chunk_size):
+        """Read the body in chunks.
+
+        Args:
+            chunk_size: size of the chunks
+
+        Yields:
+            the chunks of the body
+        """
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+
+class FakeS3Client:
+    """S3 client serving a single object, recording the ranges read."""
+
+    def __init__(self):
+        """Construct."""
+        self.ranges = []
+
+    def head_object(self, **_):
+        """Describe the object.
+
+        Returns:
+            the metadata of the object
+        """
+        return {"ContentLength": len(DATA), "ETag": ETAG, "LastModified": LAST_MODIFIED}
+
+    def get_object(self, IfMatch, Range, **_):  # noqa: N803 (the boto3 arguments)
+        """Read a range of the object.
+
+        Args:
+            IfMatch: the ETag the object must have
+            Range: the range read, as `bytes=<first>-<last>`
+            _: the bucket and key
+
+        Returns:
+            the object, with the body of the range
+        """
+        assert IfMatch == ETAG
+        self.ranges.append(Range)
+        first, last = (int(bound) for bound in Range.removeprefix("bytes=").split("-"))
+        return {"Body": FakeBody(DATA[first : last + 1])}
+
+
+def _download(headers=None, method="GET"):
+    """Send the object to a request.
+
+    Args:
+        headers: headers of the request
+        method: method of the request
+
+    Returns:
+        the status, headers and body of the response, and the ranges read from S3
+    """
+    client = FakeS3Client()
+    with Flask(__name__).test_request_context(method=method, headers=headers or {}):
+        response = send_object(client, "bucket", "key", "application/pdf", "file.pdf", False)
+        body = b"".join(response.iter_encoded())
+    return response.status_code, response.headers, body, client.ranges
+
+
+def test_send_object():
+    """arrange: A plain request.
+    act: Send the object.
+    assert: The whole object is streamed with its validators.
+    """
+    status, headers, body, ranges = _download()
+
+    assert status == 200
+    assert body == DATA
+    assert ranges == ["bytes=0-99"]
+    assert headers["ETag"] == ETAG
+    assert headers["Accept-Ranges"] == "bytes"
+    assert headers["Content-Length"] == "100"
+    assert headers["Content-Disposition"] == "attachment; filename=file.pdf"
+
+
+@pytest.mark.parametrize(
+    "range_header, status, expected, content_range",
+    [
+        pytest.param("bytes=10-19", 206, DATA[10:20], "bytes 10-19/100", id="range"),
+        pytest.param("bytes=90-", 206, DATA[90:], "bytes 90-99/100", id="open range"),
+        pytest.param("bytes=-5", 206, DATA[95:], "bytes 95-99/100", id="suffix range"),
+        pytest.param("bytes=0-9,20-29", 200, DATA, None, id="multiple ranges"),
+        pytest.param("bytes=200-299,0-9", 200, DATA, None, id="multiple ranges out of object"),
+        pytest.param("pages=1-2", 200, DATA, None, id="invalid range"),
+    ],
+)
+def test_send_object_range(range_header, status, expected, content_range):
+    """arrange: A request for byte ranges.
+    act: Send the object.
+    assert: A single range is read from S3 and sent as partial content, several
+        ranges getting the whole object.
+    """
+    response_status, headers, body, _ = _download({"Range": range_header})
+
+    assert response_status == status
+    assert body == expected
+    assert headers.get("Content-Range") == content_range
+
+
+def test_send_object_range_not_satisfiable():
+    """arrange: A request for a single range outside of the object.
+    act: Send the object.
+    assert: The range is rejected with a 416.
+    """
+    with pytest.raises(RequestedRangeNotSatisfiable):
+        _download({"Range": "bytes=100-199"})
+
+
+@pytest.mark.parametrize(
+    "if_range, status",
+    [
+        pytest.param(ETAG, 206, id="matching etag"),
+        pytest.param('"other"', 200, id="other etag"),
+        pytest.param(f"W/{ETAG}", 200, id="weak etag"),
+        pytest.param("Fri, 02 Jan 2026 03:04:05 GMT", 206, id="matching date"),
+        pytest.param("Thu, 01 Jan 2026 00:00:00 GMT", 200, id="other date"),
+    ],
+)
+def test_send_object_if_range(if_range, status):
+    """arrange: A request for a range, if the object did not change.
+    act: Send the object.
+    assert: The range is only sent when If-Range matches the object.
+    """
+    response_status, _, body, _ = _download({"Range": "bytes=10-19", "If-Range": if_range})
+
+    assert response_status == status
+    assert body == (DATA[10:20] if status == 206 else DATA)
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        pytest.param({"If-None-Match": ETAG}, id="if-none-match"),
+        pytest.param({"If-Modified-Since": "Fri, 02 Jan 2026 03:04:05 GMT"}, id="if-modified"),
+        pytest.param({"If-None-Match": ETAG, "Range": "bytes=10-19"}, id="range"),
+    ],
+)
+def test_send_object_not_modified(headers):
+    """arrange: A conditional request from a client having the object.
+    act: Send the object.
+    assert: A 304 is sent without reading the object.
+    """
+    status, _, body, ranges = _download(headers)
+
+    assert status == 304
+    assert not body
+    assert not ranges
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        pytest.param({"If-Match": '"other"'}, id="if-match"),
+        pytest.param({"If-Unmodified-Since": "Thu, 01 Jan 2026 00:00:00 GMT"}, id="unmodified"),
+        pytest.param({"If-Match": '"other"', "Range": "bytes=10-19"}, id="range"),
+    ],
+)
+def test_send_object_precondition_failed(headers):
+    """arrange: A request for the object if unchanged, which changed.
+    act: Send the object.
+    assert: The request is rejected with a 412.
+    """
+    with pytest.raises(PreconditionFailed):
+        _download(headers)
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        pytest.param({"If-Match": ETAG}, id="if-match"),
+        pytest.param({"If-Match": "*"}, id="if-match any"),
+        pytest.param({"If-Unmodified-Since": "Fri, 02 Jan 2026 03:04:05 GMT"}, id="unmodified"),
+    ],
+)
+def test_send_object_precondition(headers):
+    """arrange: A request for the object if unchanged, which did not change.
+    act: Send the object.
+    assert: The whole object is sent.
+    """
+    status, _, body, _ = _download(headers)
+
+    assert status == 200
+    assert body == DATA
+
+
+def test_send_object_head():
+    """arrange: A HEAD request for a range.
+    act: Send the object.
+    assert: The headers of the range are sent without reading the object.
+    """
+    status, headers, body, ranges = _download({"Range": "bytes=10-19"}, method="HEAD")
+
+    assert status == 206
+    assert headers["Content-Length"] == "10"
+    assert not body
+    assert not ranges
@@ -13,7 +13,24 @@ here (from ``charmcraft expand-extensions``) for use by the unit tests.
 
 CHARM_META = {
     "name": "indico",
-    "containers": {"flask-app": {"resource": "flask-app-image"}},
+    "containers": {
+        "flask-app": {
+            "resource": "flask-app-image",
+            "mounts": [{"storage": "plugin-wheels", "location": "/srv/indico/wheelhouse"}],
+        }
+    },
+    "storage": {
+        "plugin-wheels": {
+            "type": "filesystem",
+            "description": "Wheels of the plugins listed in `external_plugins`, built once "
+            "per plugin set and\n"
+            "Indico version and reused when the workload restarts, including in a "
+            "new pod.\n"
+            "Optional, the wheels being kept in the workload container without it.\n",
+            "minimum-size": "1G",
+            "multiple": {"range": "0-1"},
+        }
+    },
     "peers": {"secret-storage": {"interface": "secret-storage"}},
     "provides": {
         "metrics-endpoint": {"interface": "prometheus_scrape"},
@@ -22,6 +39,8 @@ CHARM_META = {
     "requires": {
         "postgresql": {"interface": "postgresql_client", "optional": False, "limit": 1},
         "redis": {"interface": "redis", "optional": False, "limit": 1},
+        "redis-cache": {"interface": "redis", "optional": True, "limit": 1},
+        "redis-broker": {"interface": "redis", "optional": True, "limit": 1},
         "s3": {"interface": "s3", "optional": True, "limit": 1},
         "smtp": {"interface": "smtp", "optional": True, "limit": 1},
         "saml": {"interface": "saml", "optional": True, "limit": 1},
@@ -46,22 +65,115 @@ CHARM_ACTIONS = {
         },
         "required": ["email", "password"],
     },
+    "add-users": {
+        "description": "Create many users from a file in the workload container. "
+        "Users whose email or\n"
+        "identity already exists are skipped. The users are processed in chunks "
+        "by a\n"
+        "single workload process, the progress being logged as each chunk is "
+        "committed.\n"
+        "The result of each user is written to the `results-file` in the workload\n"
+        "container.\n",
+        "params": {
+            "users-file": {
+                "type": "string",
+                "description": "Path of a file in the workload container listing the "
+                "users to create, with an\n"
+                "`email` and optionally `first_name`, `last_name`, `affiliation`, "
+                "`password`\n"
+                "(or a bcrypt `password_hash`, and `username`) for a local identity, "
+                "or\n"
+                "`provider` (and `identifier`) for an identity linked to that "
+                "provider, e.g. SSO.\n",
+            },
+            "format": {
+                "type": "string",
+                "enum": ["csv", "jsonl"],
+                "default": "csv",
+                "description": "Format of the file, CSV with a header line or one "
+                "JSON object per line.",
+            },
+            "chunk-size": {
+                "type": "integer",
+                "default": 100,
+                "minimum": 1,
+                "description": "Number of users created and committed together.",
+            },
+            "hash-workers": {
+                "type": "integer",
+                "default": 0,
+                "minimum": 0,
+                "description": "Number of processes hashing the plain text passwords "
+                "before the users of a\n"
+                "chunk are created, 0 for all the cores available to the workload.\n",
+            },
+        },
+        "required": ["users-file"],
+    },
     "anonymize-user": {
-        "description": "Anonymize stored personal data to facilitate GDPR compliance.",
+        "description": "Anonymize stored personal data to facilitate GDPR compliance. "
+        "The emails are\n"
+        "processed in chunks by a single workload process, the progress "
+        "being logged\n"
+        "as each chunk is committed. The result of each email is written "
+        "to the\n"
+        "`results-file` in the workload container.\n",
         "params": {
             "email": {
                 "type": "string",
-                "description": "User email (or a "
-                "list of emails "
-                "separated by "
-                "comma). Maximum "
-                "of 50 emails.",
-            }
-        },
-        "required": ["email"],
+                "description": "User email (or a list of emails separated by comma).",
+            },
+            "email-file": {
+                "type": "string",
+                "description": "Path of a file in the workload container listing the "
+                "emails to anonymize\n"
+                "(one or more per line, separated by comma or spaces). "
+                "Used instead of `email`.\n",
+            },
+            "chunk-size": {
+                "type": "integer",
+                "default": 100,
+                "minimum": 1,
+                "description": "Number of users anonymized and committed together.",
+            },
+            "dry-run": {
+                "type": "boolean",
+                "default": False,
+                "description": "Only count, per email, the users, registrations and "
+                "field values that would\n"
+                "be anonymized, without changing any data. The total number of rows "
+                "that\n"
+                "would be written is reported as `estimated-rows`.\n",
+            },
+            "background": {
+                "type": "boolean",
+                "default": False,
+                "description": "Queue the anonymization on the Celery worker instead "
+                "of running it in the\n"
+                "action, returning the `job-id` to give to the "
+                "`anonymize-user-status` action.\n",
+            },
+        },
+    },
+    "anonymize-user-status": {
+        "description": "Report the state of a background anonymization queued by "
+        "`anonymize-user`.\n"
+        "Once the job has finished, the result of each email is written to the\n"
+        "`results-file` in the workload container.\n",
+        "params": {
+            "job-id": {
+                "type": "string",
+                "pattern": "^[0-9a-f-]+$",
+                "description": "Id of the job returned by the `anonymize-user` action.",
+            },
+        },
+        "required": ["job-id"],
     },
     "refresh-external-resources": {
-        "description": "Reinstall/upgrade the external plugins listed in `external_plugins`."
+        "description": "Reinstall/upgrade the external plugins listed in `external_plugins`. "
+        "With\n"
+        "`plugin-bundle`, run it on the leader unit: the plugins are then rebuilt\n"
+        "and reinstalled on all the units.\n"
     },
     "rotate-secret-key": {
         "description": "Rotate the secret key. Users will be "
@@ -157,6 +269,16 @@ CHARM_CONFIG = {
             "the public PyPI index is "
             "used.\n",
         },
+        "plugin-bundle": {
+            "type": "boolean",
+            "default": False,
+            "description": "Whether the `external_plugins` are built once and "
+            "shared between the\n"
+            "units through the bucket of the `s3` relation. The leader unit builds\n"
+            "them and uploads its installed plugins as a tarball, which the other\n"
+            "units download and unpack instead of building the plugins themselves.\n"
+            "Has no effect without the `s3` relation.\n",
+        },
         "local-identities": {
             "type": "boolean",
             "default": True,
@@ -170,6 +292,164 @@ CHARM_CONFIG = {
             "authentication exclusively "
             "through SSO.\n",
         },
+        "retention-days": {
+            "type": "int",
+            "default": 0,
+            "description": "Number of days without login after which a user is "
+            "automatically\n"
+            "anonymized by the scheduled retention sweep. Users who never logged\n"
+            "in are counted from their creation. Admins are never anonymized.\n"
+            "0 disables the sweep.\n",
+        },
+        "retention-batch-size": {
+            "type": "int",
+            "default": 100,
+            "description": "Number of inactive users anonymized and committed "
+            "together by the\n"
+            "retention sweep.\n",
+        },
+        "retention-window": {
+            "type": "string",
+            "default": "01:00-05:00",
+            "description": "UTC time range, as `HH:MM-HH:MM`, during which the "
+            "retention sweep\n"
+            "runs, so the load stays off peak hours. The range may span midnight.\n"
+            "Empty value lets the sweep run at any time.\n",
+        },
+        "preload-app": {
+            "type": "boolean",
+            "default": False,
+            "description": "Whether Gunicorn creates the Indico app once in its master "
+            "process\n"
+            "before forking the workers, instead of once per worker. The workers\n"
+            "share the memory of the preloaded app copy-on-write and respawn\n"
+            "faster; their database and Redis connections are reset after the\n"
+            "fork. Only supported with the `sync` worker class.\n",
+        },
+        "gunicorn-max-requests": {
+            "type": "int",
+            "default": 0,
+            "description": "Number of requests after which a Gunicorn worker is restarted, to\n"
+            "bound the memory it leaks. 0 never restarts the workers.\n",
+        },
+        "gunicorn-max-requests-jitter": {
+            "type": "int",
+            "default": 0,
+            "description": "Maximum random number of requests added to `gunicorn-max-requests`\n"
+            "for each worker, so the workers do not all restart at once.\n",
+        },
+        "gunicorn-graceful-timeout": {
+            "type": "int",
+            "default": 0,
+            "description": "Time in seconds given to the Gunicorn workers to finish their "
+            "requests\n"
+            "when restarted. 0 uses the Gunicorn default of 30 seconds.\n",
+        },
+        "redis-cache-db": {
+            "type": "int",
+            "default": 1,
+            "description": "Redis database index of the Indico cache, so flushing the cache "
+            "never\n"
+            "touches the Celery queues.\n",
+        },
+        "redis-broker-db": {
+            "type": "int",
+            "default": 0,
+            "description": "Redis database index of the Celery broker queues.\n",
+        },
+        "redis-result-db": {
+            "type": "int",
+            "default": 2,
+            "description": "Redis database index of the Celery task results.\n",
+        },
+        "redis-cache-maxmemory-policy": {
+            "type": "string",
+            "default": "allkeys-lru",
+            "description": "`maxmemory-policy` set on the Redis of the `redis-cache` "
+            "relation,\n"
+            "which only holds the cache. Empty value leaves the policy unchanged.\n",
+        },
+        "redis-broker-maxmemory-policy": {
+            "type": "string",
+            "default": "noeviction",
+            "description": "`maxmemory-policy` set on the Redis of the `redis-broker` "
+            "relation,\n"
+            "which only holds the Celery broker queues, so queued tasks are never\n"
+            "evicted. The Redis of the `redis` relation, possibly shared, keeps its\n"
+            "own policy. Empty value leaves the policy unchanged.\n",
+        },
+        "db-pool-size": {
+            "type": "int",
+            "default": 5,
+            "description": "Number of connections kept open in the SQLAlchemy pool of each "
+            "Indico\n"
+            "process.\n",
+        },
+        "db-max-overflow": {
+            "type": "int",
+            "default": 3,
+            "description": "Number of connections an Indico process may open on top of\n"
+            "`db-pool-size` under load, closed once returned to the pool.\n",
+        },
+        "db-pool-recycle": {
+            "type": "int",
+            "default": 120,
+            "description": "Age in seconds after which a pooled connection is replaced, to "
+            "stay\n"
+            "below the idle timeouts of the database and the proxies in between.\n"
+            "-1 never replaces them.\n",
+        },
+        "db-pool-pre-ping": {
+            "type": "boolean",
+            "default": False,
+            "description": "Whether each pooled connection is checked with a ping when "
+            "taken from\n"
+            "the pool, and replaced if the server closed it.\n",
+        },
+        "db-pgbouncer": {
+            "type": "boolean",
+            "default": False,
+            "description": "Whether the `postgresql` relation goes through PgBouncer in "
+            "transaction\n"
+            "pooling mode, e.g. pgbouncer-k8s. The Indico processes then keep no\n"
+            "connection open, PgBouncer sharing the server connections between them,\n"
+            "and never prepare statements on the server. The `db-pool-*` options\n"
+            "are ignored.\n",
+        },
+        "db-read-replicas": {
+            "type": "boolean",
+            "default": False,
+            "description": "Whether to send the reads of the GET requests listed in\n"
+            "`db-replica-endpoints` to the read-only replicas of the `postgresql`\n"
+            "relation. Writes, and the reads following them, always go to the\n"
+            "primary.\n",
+        },
+        "db-replica-max-lag": {
+            "type": "int",
+            "default": 10,
+            "description": "Maximum replication lag, in seconds, of a replica serving reads. A\n"
+            "replica lagging further behind is skipped until it catches up. A user\n"
+            "also reads from the primary for this long after a write.\n",
+        },
+        "db-replica-endpoints": {
+            "type": "string",
+            "default": "categories.display categories.event_list events.display "
+            "timetable.timetable search.search search.api_search",
+            "description": "Space separated Indico endpoints whose GET requests may read from "
+            "the\n"
+            "replicas when `db-read-replicas` is enabled.\n",
+        },
+        "s3-download-mode": {
+            "type": "string",
+            "default": "proxy",
+            "description": "How the files stored in the bucket of the `s3` relation are "
+            "downloaded.\n"
+            "`proxy` streams them through Indico. `redirect` sends the clients to a\n"
+            "presigned S3 URL valid for two minutes, which requires the S3 endpoint\n"
+            "to be reachable by them. `auto` redirects when the endpoint is public\n"
+            "(AWS, or a public HTTPS host) and proxies for internal endpoints, such\n"
+            "as an in-cluster MinIO. Any other value blocks the unit.\n",
+        },
         "webserver-keepalive": {
             "type": "int",
             "description": "Time in seconds for "
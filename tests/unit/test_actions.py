@@ -5,6 +5,7 @@
 
 """Unit tests for the Indico charm actions."""
 
+import json
 from secrets import token_hex
 from unittest.mock import patch
 
@@ -12,7 +13,7 @@ import ops
 import ops.testing
 import pytest
 
-from charm import INDICO_WRAPPER, IndicoCharm
+from charm import INDICO_ADMIN_CLIENT, PLUGIN_WHEELHOUSE, IndicoCharm
 
 from .charm_metadata import CHARM_ACTIONS, CHARM_CONFIG, CHARM_META
 
@@ -48,7 +49,7 @@ def test_add_admin_success(
     email = f"{token_hex(4)}@example.com"
     password = token_hex(8)
     mock_exec = ops.testing.Exec(
-        command_prefix=[INDICO_WRAPPER, "indico", "autocreate", "admin"],
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "autocreate", "admin"],
         return_code=0,
         stdout="Created admin",
     )
@@ -65,6 +66,8 @@ def test_add_admin_success(
     assert context.action_results is not None
     assert context.action_results["user"] == email
     assert context.action_results["output"] == "Created admin"
+    [exec_args] = context.exec_history["flask-app"]
+    assert exec_args.stdin == ""
 
 
 @patch.object(IndicoCharm, "_gen_environment", return_value={})
@@ -77,7 +80,7 @@ def test_add_admin_exec_error(
     """
     email = f"{token_hex(4)}@example.com"
     mock_exec = ops.testing.Exec(
-        command_prefix=[INDICO_WRAPPER, "indico", "autocreate", "admin"],
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "autocreate", "admin"],
         return_code=1,
         stdout="boom",
     )
@@ -116,19 +119,158 @@ def test_add_admin_container_not_ready(
     assert "Cannot connect to the Indico workload container" in exc.value.message
 
 
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_add_users_success(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container that returns a successful bulk user creation.
+    act: Run the add-users action.
+    assert: The command reads the users file and the progress and summary are reported.
+    """
+    output = [
+        json.dumps({"progress": {"processed": 2, "created": 1, "skipped": 1}}),
+        json.dumps({"summary": {"processed": 2, "created": 1, "skipped": 1}}),
+    ]
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "autocreate", "users"],
+        return_code=0,
+        stdout="\n".join(output),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    context.run(
+        context.on.action(
+            "add-users",
+            params={
+                "users-file": "/srv/indico/tmp/users.csv",
+                "format": "csv",
+                "chunk-size": 50,
+                "hash-workers": 4,
+            },
+        ),
+        state_in,
+    )
+
+    assert context.action_results is not None
+    assert context.action_results["created"] == 1
+    assert context.action_results["skipped"] == 1
+    assert context.action_results["failed"] == 0
+    assert context.action_logs == ["Processed 2 users: 1 created, 1 skipped, 0 failed"]
+    [exec_args] = context.exec_history["flask-app"]
+    command = exec_args.command
+    assert command[command.index("--input") + 1] == "/srv/indico/tmp/users.csv"
+    assert command[command.index("--format") + 1] == "csv"
+    assert command[command.index("--chunk-size") + 1] == "50"
+    assert command[command.index("--hash-workers") + 1] == "4"
+
+
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_add_users_partial_error(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container whose bulk user creation fails for one of the users.
+    act: Run the add-users action.
+    assert: The action fails and the summary is reported.
+    """
+    summary = {"processed": 2, "created": 1, "error": 1}
+    output = [json.dumps({"progress": summary}), json.dumps({"summary": summary})]
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "autocreate", "users"],
+        return_code=1,
+        stdout="\n".join(output),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(
+            context.on.action(
+                "add-users",
+                params={
+                    "users-file": "/srv/indico/tmp/users.jsonl",
+                    "format": "jsonl",
+                    "chunk-size": 100,
+                    "hash-workers": 0,
+                },
+            ),
+            state_in,
+        )
+
+    assert "Failed to create one or more users" in exc.value.message
+    assert context.action_results is not None
+    assert context.action_results["failed"] == 1
+
+
 @patch.object(IndicoCharm, "_gen_environment", return_value={})
 def test_anonymize_user_success(
     _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
 ) -> None:
     """arrange: A container that returns a successful anonymize execution.
     act: Run the anonymize-user action with two emails.
-    assert: The action reports the anonymized emails.
+    assert: The emails are streamed to a single command, the progress is logged and
+        the summary is reported.
     """
     emails = "a@example.com,b@example.com"
+    output = [
+        "Installing plugins",
+        json.dumps({"progress": {"processed": 2, "anonymized": 1, "not-found": 1}}),
+        json.dumps(
+            {
+                "summary": {"processed": 2, "anonymized": 1, "not-found": 1},
+                "field-type-cache": {"hits": 3, "misses": 2, "size": 2},
+            }
+        ),
+    ]
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "users"],
+        return_code=0,
+        stdout="\n".join(output),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    context.run(
+        context.on.action("anonymize-user", params={"email": emails, "chunk-size": 100}),
+        state_in,
+    )
+
+    assert context.action_results is not None
+    assert context.action_results["processed"] == 2
+    assert context.action_results["anonymized"] == 1
+    assert context.action_results["not-found"] == 1
+    assert context.action_results["failed"] == 0
+    assert context.action_results["results-file"].startswith("/srv/indico/log/anonymize-")
+    assert context.action_logs == ["Processed 2 emails: 1 anonymized, 1 not found, 0 failed"]
+    [exec_args] = context.exec_history["flask-app"]
+    assert exec_args.stdin == "a@example.com\nb@example.com"
+    assert "--output" in exec_args.command
+    assert exec_args.command[exec_args.command.index("--chunk-size") + 1] == "100"
+
+
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_anonymize_user_email_file(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container that returns a successful anonymize execution.
+    act: Run the anonymize-user action with a file of emails and a custom chunk size.
+    assert: The command reads the emails from the file in chunks of the given size.
+    """
+    output = [
+        json.dumps({"progress": {"processed": 500, "anonymized": 500}}),
+        json.dumps({"progress": {"processed": 1000, "anonymized": 1000}}),
+        json.dumps({"summary": {"processed": 1000, "anonymized": 1000}}),
+    ]
     mock_exec = ops.testing.Exec(
-        command_prefix=[INDICO_WRAPPER, "indico", "anonymize", "user"],
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "users"],
         return_code=0,
-        stdout="anonymized",
+        stdout="\n".join(output),
     )
     container = ops.testing.Container(
         name="flask-app", can_connect=True, execs={mock_exec}
@@ -136,25 +278,109 @@ def test_anonymize_user_success(
     state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
 
     context.run(
-        context.on.action("anonymize-user", params={"email": emails}),
+        context.on.action(
+            "anonymize-user",
+            params={"email-file": "/srv/indico/tmp/emails.txt", "chunk-size": 500},
+        ),
         state_in,
     )
 
     assert context.action_results is not None
-    assert context.action_results["user"] == emails
+    assert context.action_results["anonymized"] == 1000
+    assert len(context.action_logs) == 2
+    [exec_args] = context.exec_history["flask-app"]
+    command = exec_args.command
+    assert command[command.index("--input") + 1] == "/srv/indico/tmp/emails.txt"
+    assert command[command.index("--chunk-size") + 1] == "500"
+    # The admin client reads its standard input until EOF
+    assert exec_args.stdin == ""
+
+
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_anonymize_user_dry_run(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container that returns a successful dry-run anonymize execution.
+    act: Run the anonymize-user action in dry-run mode.
+    assert: The command only counts the rows and the estimation is reported.
+    """
+    report = {"processed": 2, "found": 1, "not-found": 1, "estimated-rows": 9}
+    output = [json.dumps({"progress": report}), json.dumps({"summary": report})]
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "users"],
+        return_code=0,
+        stdout="\n".join(output),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    context.run(
+        context.on.action(
+            "anonymize-user",
+            params={"email": "a@example.com,b@example.com", "chunk-size": 100, "dry-run": True},
+        ),
+        state_in,
+    )
+
+    assert context.action_results is not None
+    assert context.action_results["found"] == 1
+    assert context.action_results["estimated-rows"] == 9
+    assert context.action_results["anonymized"] == 0
+    assert context.action_logs == ["Counted 2 emails: 1 found, 1 not found, 9 rows to anonymize"]
+    [exec_args] = context.exec_history["flask-app"]
+    assert "--dry-run" in exec_args.command
+
+
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_anonymize_user_partial_error(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container whose anonymize execution fails for one of the emails.
+    act: Run the anonymize-user action with two emails.
+    assert: The action fails and the summary is reported.
+    """
+    output = [
+        json.dumps({"progress": {"processed": 2, "anonymized": 1, "error": 1}}),
+        json.dumps({"summary": {"processed": 2, "anonymized": 1, "error": 1}}),
+    ]
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "users"],
+        return_code=1,
+        stdout="\n".join(output),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(
+            context.on.action(
+                "anonymize-user",
+                params={"email": "a@example.com,b@example.com", "chunk-size": 100},
+            ),
+            state_in,
+        )
+
+    assert "Failed to anonymize one or more users" in exc.value.message
+    assert context.action_results is not None
+    assert context.action_results["anonymized"] == 1
+    assert context.action_results["failed"] == 1
 
 
 @patch.object(IndicoCharm, "_gen_environment", return_value={})
 def test_anonymize_user_exec_error(
     _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
 ) -> None:
-    """arrange: A container whose anonymize execution fails.
+    """arrange: A container whose anonymize execution fails without reporting results.
     act: Run the anonymize-user action.
-    assert: The action fails and the per-email failure is reported in the output.
+    assert: The action fails.
     """
     email = "a@example.com"
     mock_exec = ops.testing.Exec(
-        command_prefix=[INDICO_WRAPPER, "indico", "anonymize", "user"],
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "users"],
         return_code=1,
         stdout="boom",
     )
@@ -165,7 +391,9 @@ def test_anonymize_user_exec_error(
 
     with pytest.raises(ops.testing.ActionFailed) as exc:
         context.run(
-            context.on.action("anonymize-user", params={"email": email}),
+            context.on.action(
+                "anonymize-user", params={"email": email, "chunk-size": 100}
+            ),
             state_in,
         )
 
@@ -191,40 +419,202 @@ def test_anonymize_user_container_not_ready(
     assert "Cannot connect to the Indico workload container" in exc.value.message
 
 
+def test_anonymize_user_missing_emails(
+    context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container ready to run commands.
+    act: Run the anonymize-user action without email nor email-file.
+    assert: The action fails because there is no email to anonymize.
+    """
+    container = ops.testing.Container(name="flask-app", can_connect=True)
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(context.on.action("anonymize-user"), state_in)
+
+    assert "either email or email-file must be set" in exc.value.message
+
+
 @patch.object(IndicoCharm, "_gen_environment", return_value={})
-def test_anonymize_user_too_many_emails(
+def test_anonymize_user_background(
     _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
 ) -> None:
-    """arrange: An email list longer than the allowed maximum.
-    act: Run the anonymize-user action.
-    assert: The action fails because too many emails were supplied.
+    """arrange: A container that queues the anonymization job.
+    act: Run the anonymize-user action in the background.
+    assert: The emails are queued and the job id is returned.
+    """
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "enqueue"],
+        return_code=0,
+        stdout="Installing plugins\n" + json.dumps({"job-id": "1234-abcd", "emails": 2}),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    context.run(
+        context.on.action(
+            "anonymize-user",
+            params={
+                "email": "a@example.com,b@example.com",
+                "chunk-size": 10,
+                "background": True,
+            },
+        ),
+        state_in,
+    )
+
+    assert context.action_results == {"job-id": "1234-abcd", "emails": 2}
+    [exec_args] = context.exec_history["flask-app"]
+    assert exec_args.command[-2:] == ["--chunk-size", "10"]
+    assert exec_args.stdin == "a@example.com\nb@example.com"
+
+
+def test_anonymize_user_background_dry_run(
+    context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container ready to run commands.
+    act: Run the anonymize-user action in the background and in dry-run mode.
+    assert: The action fails because a dry-run cannot be queued.
     """
-    emails = ",".join(f"user{i}@example.com" for i in range(51))
     container = ops.testing.Container(name="flask-app", can_connect=True)
     state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
 
     with pytest.raises(ops.testing.ActionFailed) as exc:
         context.run(
-            context.on.action("anonymize-user", params={"email": emails}),
+            context.on.action(
+                "anonymize-user",
+                params={"email": "a@example.com", "background": True, "dry-run": True},
+            ),
             state_in,
         )
 
-    assert "more than 50 emails not allowed" in exc.value.message
+    assert "dry-run cannot run in the background" in exc.value.message
+
+
+@pytest.mark.parametrize(
+    "status, expected",
+    [
+        pytest.param(
+            {"job-id": "1234-abcd", "state": "PENDING"},
+            {"job-id": "1234-abcd", "state": "PENDING"},
+            id="pending",
+        ),
+        pytest.param(
+            {
+                "job-id": "1234-abcd",
+                "state": "PROGRESS",
+                "progress": {"processed": 10, "total": 30, "anonymized": 10},
+            },
+            {
+                "job-id": "1234-abcd",
+                "state": "PROGRESS",
+                "processed": 10,
+                "total": 30,
+                "anonymized": 10,
+                "not-found": 0,
+                "failed": 0,
+            },
+            id="progress",
+        ),
+        pytest.param(
+            {
+                "job-id": "1234-abcd",
+                "state": "SUCCESS",
+                "summary": {"processed": 30, "anonymized": 29, "not-found": 1},
+            },
+            {
+                "job-id": "1234-abcd",
+                "state": "SUCCESS",
+                "processed": 30,
+                "anonymized": 29,
+                "not-found": 1,
+                "failed": 0,
+                "results-file": "/srv/indico/log/anonymize-1234-abcd.jsonl",
+            },
+            id="success",
+        ),
+    ],
+)
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_anonymize_user_status(
+    _mock_env,
+    status: dict,
+    expected: dict,
+    context: ops.testing.Context,
+    peer: ops.testing.PeerRelation,
+) -> None:
+    """arrange: A container that reports the status of an anonymization job.
+    act: Run the anonymize-user-status action.
+    assert: The state of the job and its progress or summary are reported.
+    """
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "status"],
+        return_code=0,
+        stdout=json.dumps(status),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    context.run(
+        context.on.action("anonymize-user-status", params={"job-id": "1234-abcd"}),
+        state_in,
+    )
+
+    assert context.action_results == expected
+    [exec_args] = context.exec_history["flask-app"]
+    assert exec_args.command[-3:] == [
+        "1234-abcd",
+        "--output",
+        "/srv/indico/log/anonymize-1234-abcd.jsonl",
+    ]
+
+
+@patch.object(IndicoCharm, "_gen_environment", return_value={})
+def test_anonymize_user_status_job_failed(
+    _mock_env, context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A container that reports an anonymization job which raised an error.
+    act: Run the anonymize-user-status action.
+    assert: The action fails with the error of the job.
+    """
+    status = {"job-id": "1234-abcd", "state": "FAILURE", "error": "OperationalError()"}
+    mock_exec = ops.testing.Exec(
+        command_prefix=[INDICO_ADMIN_CLIENT, "indico", "anonymize", "status"],
+        return_code=0,
+        stdout=json.dumps(status),
+    )
+    container = ops.testing.Container(
+        name="flask-app", can_connect=True, execs={mock_exec}
+    )
+    state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(
+            context.on.action("anonymize-user-status", params={"job-id": "1234-abcd"}),
+            state_in,
+        )
+
+    assert "Anonymization job 1234-abcd failed: OperationalError()" in exc.value.message
 
 
 def test_refresh_external_resources(
     context: ops.testing.Context, peer: ops.testing.PeerRelation
 ) -> None:
-    """arrange: A container that accepts the marker removal command.
+    """arrange: A container that accepts the marker and wheels removal commands.
     act: Run the refresh-external-resources action.
-    assert: The action reports that a refresh was triggered.
+    assert: The action clears the cached wheels and reports that a refresh was triggered.
     """
-    mock_exec = ops.testing.Exec(
+    mock_rm = ops.testing.Exec(
         command_prefix=["rm", "-f", "/srv/indico/plugins/.installed"],
         return_code=0,
     )
+    mock_find = ops.testing.Exec(command_prefix=["find", PLUGIN_WHEELHOUSE], return_code=0)
     container = ops.testing.Container(
-        name="flask-app", can_connect=True, execs={mock_exec}
+        name="flask-app", can_connect=True, execs={mock_rm, mock_find}
     )
     state_in = ops.testing.State(leader=True, containers={container}, relations={peer})
 
@@ -236,6 +626,57 @@ def test_refresh_external_resources(
 
     assert context.action_results is not None
     assert context.action_results["result"] == "external plugins refresh triggered"
+    assert [exec_args.command[0] for exec_args in context.exec_history["flask-app"]] == [
+        "rm",
+        "find",
+    ]
+
+
+def test_refresh_external_resources_plugin_bundle(context: ops.testing.Context) -> None:
+    """arrange: A leader unit with plugin-bundle enabled and the s3 relation.
+    act: Run the refresh-external-resources action.
+    assert: The generation of the plugins is bumped for all the units, nothing being
+        removed from the workload.
+    """
+    peer = ops.testing.PeerRelation(
+        endpoint="secret-storage",
+        local_app_data={"flask_secret_key": "test-secret-key", "plugins-generation": "1"},
+    )
+    s3 = ops.testing.Relation(endpoint="s3")
+    container = ops.testing.Container(name="flask-app", can_connect=True)
+    state_in = ops.testing.State(
+        leader=True,
+        containers={container},
+        relations={peer, s3},
+        config={"plugin-bundle": True},
+    )
+
+    with patch.object(IndicoCharm, "restart"):
+        state_out = context.run(context.on.action("refresh-external-resources"), state_in)
+
+    assert context.action_results is not None
+    assert context.action_results["result"] == "external plugins refresh triggered on all units"
+    assert state_out.get_relation(peer.id).local_app_data["plugins-generation"] == "2"
+    assert not context.exec_history.get("flask-app")
+
+
+def test_refresh_external_resources_plugin_bundle_not_leader(
+    context: ops.testing.Context, peer: ops.testing.PeerRelation
+) -> None:
+    """arrange: A non-leader unit with plugin-bundle enabled and the s3 relation.
+    act: Run the refresh-external-resources action.
+    assert: The action fails, only the leader refreshing the shared plugins.
+    """
+    s3 = ops.testing.Relation(endpoint="s3")
+    container = ops.testing.Container(name="flask-app", can_connect=True)
+    state_in = ops.testing.State(
+        containers={container}, relations={peer, s3}, config={"plugin-bundle": True}
+    )
+
+    with pytest.raises(ops.testing.ActionFailed) as exc:
+        context.run(context.on.action("refresh-external-resources"), state_in)
+
+    assert "Only the leader unit" in exc.value.message
 
 
 def test_refresh_external_resources_container_not_ready(